@@ -1,6 +1,7 @@
 import os
+import requests
 from supabase import create_client, Client
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, BinaryIO, Iterable, Union
 
 
 class Database:
@@ -59,6 +60,13 @@ class Database:
         result = self.supabase.table('highlights').insert(highlight_data).execute()
         return result.data[0] if result.data else None
     
+    async def create_highlights(self, highlights_data: List[dict]) -> List[dict]:
+        """Create several highlight records in one request."""
+        if not highlights_data:
+            return []
+        result = self.supabase.table('highlights').insert(highlights_data).execute()
+        return result.data or []
+    
     async def get_highlights(self, video_id: str) -> List[dict]:
         """Get highlights for a video."""
         result = self.supabase.table('highlights').select("*").eq('video_id', video_id).order('score', desc=True).execute()
@@ -74,6 +82,11 @@ class Database:
         result = self.supabase.table('clips').select("*").eq('id', clip_id).execute()
         return result.data[0] if result.data else None
     
+    async def get_clip_bundle(self, clip_id: str) -> Optional[dict]:
+        """Get a clip with its highlight and video embedded, in one request."""
+        result = self.supabase.table('clips').select("*, highlight:highlights(*), video:videos(*)").eq('id', clip_id).execute()
+        return result.data[0] if result.data else None
+    
     async def get_user_clips(self, user_id: str, limit: int = 20) -> List[dict]:
         """Get clips for a user."""
         result = self.supabase.table('clips').select("*").eq('user_id', user_id).order('created_at', desc=True).limit(limit).execute()
@@ -111,11 +124,31 @@ class Storage:
         self.supabase = supabase_client
         self.bucket_name = "videos"
     
-    def upload_file(self, file_path: str, file_data: bytes) -> str:
-        """Upload file to Supabase storage."""
+    def upload_file(self, file_path: str, file_data: Union[bytes, BinaryIO]) -> str:
+        """Upload file to Supabase storage.
+        
+        ``file_data`` may be an open binary file, which is streamed rather
+        than read into memory first.
+        """
         result = self.supabase.storage.from_(self.bucket_name).upload(file_path, file_data)
         return result.path if hasattr(result, 'path') else file_path
     
+    def upload_stream(self, file_path: str, chunks: Iterable[bytes], content_type: str = "video/mp4") -> str:
+        """Upload a file of unknown length from an iterator of byte chunks.
+        
+        The body is sent with chunked transfer encoding, so only one chunk is
+        held in memory at a time.
+        """
+        url = f"{self.supabase.supabase_url}/storage/v1/object/{self.bucket_name}/{file_path}"
+        headers = {
+            "Authorization": f"Bearer {self.supabase.supabase_key}",
+            "apikey": self.supabase.supabase_key,
+            "Content-Type": content_type
+        }
+        response = requests.post(url, data=chunks, headers=headers, timeout=60)
+        response.raise_for_status()
+        return file_path
+    
     def get_public_url(self, file_path: str) -> str:
         """Get public URL for a file."""
         result = self.supabase.storage.from_(self.bucket_name).get_public_url(file_path)
@@ -126,6 +159,23 @@ class Storage:
         result = self.supabase.storage.from_(self.bucket_name).download(file_path)
         return result
     
+    def create_signed_url(self, file_path: str, expires_in: int = 600) -> str:
+        """Get a time-limited URL for reading a file; it supports HTTP range requests."""
+        signed = self.supabase.storage.from_(self.bucket_name).create_signed_url(file_path, expires_in)
+        return signed.get("signedURL") or signed.get("signedUrl")
+    
+    def download_file_to(self, file_path: str, fileobj: BinaryIO, chunk_size: int = 1024 * 1024) -> int:
+        """Stream a file from Supabase storage into an open binary file, in chunks."""
+        url = self.create_signed_url(file_path)
+        
+        written = 0
+        with requests.get(url, stream=True, timeout=60) as response:
+            response.raise_for_status()
+            for chunk in response.iter_content(chunk_size=chunk_size):
+                fileobj.write(chunk)
+                written += len(chunk)
+        return written
+    
     def delete_file(self, file_path: str) -> bool:
         """Delete file from Supabase storage."""
         try:
@@ -0,0 +1,59 @@
+import threading
+from datetime import datetime
+from typing import Dict, Any, Optional
+
+# Minimum spacing between progress writes for one job, in seconds
+PROGRESS_FLUSH_INTERVAL = 0.5
+
+
+class ProgressReporter:
+    """Coalesce job progress updates into at most one database write per interval.
+
+    Intermediate updates are written from a background timer so workers do not
+    block on a database round-trip per step. Terminal status goes through
+    finish(), which writes synchronously and supersedes anything pending.
+    """
+
+    def __init__(self, db, job_id: str, interval: float = PROGRESS_FLUSH_INTERVAL):
+        self.db = db
+        self.job_id = job_id
+        self.interval = interval
+        self._pending: Dict[str, Any] = {}
+        self._timer: Optional[threading.Timer] = None
+        self._state_lock = threading.Lock()
+        # Serializes writes so a late timer flush cannot land after finish()
+        self._write_lock = threading.Lock()
+
+    def set(self, progress: int, **fields):
+        """Record new progress (and any extra job fields) to be written shortly."""
+        with self._state_lock:
+            self._pending.update(fields)
+            self._pending["progress"] = progress
+            if self._timer is None:
+                self._timer = threading.Timer(self.interval, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def flush(self):
+        """Write any pending updates now."""
+        with self._write_lock:
+            updates = self._take_pending()
+            if updates:
+                self._write(updates)
+
+    def finish(self, updates: Dict[str, Any]):
+        """Write a terminal job update synchronously, merged over pending progress."""
+        with self._write_lock:
+            self._write({**self._take_pending(), **updates})
+
+    def _take_pending(self) -> Dict[str, Any]:
+        with self._state_lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            updates, self._pending = self._pending, {}
+        return updates
+
+    def _write(self, updates: Dict[str, Any]):
+        updates["updated_at"] = datetime.utcnow().isoformat()
+        self.db.update_job(self.job_id, updates)
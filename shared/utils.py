@@ -37,6 +37,31 @@ def extract_youtube_video_id(url: str) -> Optional[str]:
     return None
 
 
+def get_temp_dir(required_bytes: int) -> Optional[str]:
+    """Pick a directory for a large temp file.
+    
+    Returns the RAM-backed /dev/shm when it has room for twice
+    required_bytes, otherwise None so tempfile uses its default directory.
+    """
+    if required_bytes <= 0 or not os.path.isdir(SHM_DIR):
+        return None
+    try:
+        stats = os.statvfs(SHM_DIR)
+    except OSError:
+        return None
+    return SHM_DIR if stats.f_bavail * stats.f_frsize > 2 * required_bytes else None
+
+
+def cpu_threads_per_worker() -> int:
+    """CPU threads one worker process should give its inference libraries.
+    
+    The worker supervisor sets WORKER_PROCESS_COUNT, so processes running
+    side by side split the cores rather than each claiming all of them.
+    """
+    processes = max(1, int(os.environ.get("WORKER_PROCESS_COUNT", "1")))
+    return max(1, (os.cpu_count() or 1) // processes)
+
+
 def format_duration(seconds: float) -> str:
     """Convert seconds to human-readable duration."""
     hours = int(seconds // 3600)
@@ -121,6 +146,7 @@ def format_file_size(size_bytes: int) -> str:
 
 
 # Constants
+SHM_DIR = "/dev/shm"
 MAX_FILE_SIZE_FREE = 100 * 1024 * 1024  # 100MB for free users
 MAX_FILE_SIZE_PREMIUM = 1024 * 1024 * 1024  # 1GB for premium users
 MAX_CLIPS_PER_DAY_FREE = 3
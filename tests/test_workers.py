@@ -1,5 +1,5 @@
 import pytest
-from unittest.mock import patch, Mock, MagicMock
+from unittest.mock import patch, Mock, MagicMock, mock_open
 import tempfile
 import os
 
@@ -13,11 +13,9 @@ def test_transcription_worker_success(mock_database, mock_whisper_model, sample_
     mock_database.create_transcript.return_value = {"id": "test-transcript-id"}
     mock_database.storage.download_file.return_value = b"fake video data"
     
-    # Mock MoviePy
-    with patch('moviepy.editor.VideoFileClip') as mock_video_clip:
-        mock_clip = Mock()
-        mock_clip.audio = Mock()
-        mock_video_clip.return_value.__enter__.return_value = mock_clip
+    # Mock ffmpeg audio extraction
+    with patch('workers.transcription.extract_audio_pcm') as mock_extract:
+        mock_extract.return_value = Mock()
         
         # Mock tempfile
         with patch('tempfile.NamedTemporaryFile') as mock_temp:
@@ -39,7 +37,7 @@ def test_highlight_detection_success(mock_database, sample_video, sample_transcr
     mock_database.get_video.return_value = sample_video
     mock_database.get_transcript.return_value = sample_transcript
     mock_database.update_job.return_value = None
-    mock_database.create_highlight.return_value = {"id": "test-highlight-id"}
+    mock_database.create_highlights.return_value = [{"id": "test-highlight-id"}]
     mock_database.storage.download_file.return_value = b"fake video data"
     
     # Mock video processing
@@ -58,32 +56,46 @@ def test_highlight_detection_success(mock_database, sample_video, sample_transcr
             # Verify database calls
             mock_database.get_video.assert_called_with("test-video-id")
             mock_database.get_transcript.assert_called_with("test-video-id")
-            assert mock_database.create_highlight.call_count >= 1
+            mock_database.create_highlights.assert_called_once()
 
 def test_video_editor_export_success(mock_database, mock_video_clip, sample_clip, sample_highlight, sample_video):
     """Test successful clip export."""
     from workers.video_editor import export_clip
     
     # Mock database responses
-    mock_database.get_clip.return_value = sample_clip
-    mock_database.get_highlights.return_value = [sample_highlight]
-    mock_database.get_video.return_value = sample_video
+    mock_database.get_clip_bundle.return_value = {**sample_clip, "highlight": sample_highlight, "video": sample_video}
     mock_database.get_transcript.return_value = {"segments": []}
     mock_database.update_job.return_value = None
     mock_database.update_clip.return_value = None
     mock_database.storage.download_file.return_value = b"fake video data"
     mock_database.storage.upload_file.return_value = "uploaded_path"
     
-    with patch('tempfile.NamedTemporaryFile') as mock_temp:
-        mock_temp.return_value.__enter__.return_value.name = "temp_file.mp4"
+    # Mock ffprobe and the ffmpeg encode
+    with patch('workers.video_editor.probe_video') as mock_probe, \
+         patch('workers.video_editor.render_clip') as mock_render, \
+         patch('workers.video_editor.get_intro_card') as mock_intro, \
+         patch('workers.video_editor.prepend_intro') as mock_prepend, \
+         patch('workers.video_editor.storage'), \
+         patch('builtins.open', mock_open(read_data=b"fake clip data")):
+        mock_probe.return_value = {"duration": 120.5, "width": 1920, "height": 1080, "fps": 30.0, "has_audio": True}
         
         # Run clip export
         export_clip("test-clip-id", True, "test-job-id")
         
+        # Watermark is drawn in the same ffmpeg filtergraph as the crop
+        video_filter = mock_render.call_args[0][4]
+        assert video_filter.startswith("crop=")
+        assert "drawtext=" in video_filter
+        
+        # Free-tier clips are joined to the cached intro card
+        mock_intro.assert_called_once()
+        mock_prepend.assert_called_once()
+        
         # Verify database calls
-        mock_database.get_clip.assert_called_with("test-clip-id")
+        mock_database.get_clip_bundle.assert_called_once_with("test-clip-id")
         mock_database.update_clip.assert_called_once()
-        assert mock_database.update_job.call_count >= 2
+        # Intermediate progress is coalesced; the final status is always written
+        assert mock_database.update_job.call_count >= 1
 
 def test_face_tracking_analysis(mock_database, sample_video):
     """Test face tracking analysis."""
@@ -154,7 +166,7 @@ def test_enhanced_transcription_with_speaker_detection(mock_database, sample_vid
                                 }
                             ]}
                             
-                            with patch('moviepy.editor.VideoFileClip'), \
+                            with patch('workers.enhanced_transcription.extract_audio_pcm'), \
                                  patch('tempfile.NamedTemporaryFile') as mock_temp:
                                 mock_temp.return_value.__enter__.return_value.name = "temp_file"
                                 
@@ -170,27 +182,29 @@ def test_video_processor_youtube_download():
     
     with patch('workers.video_processor.db') as mock_db:
         mock_db.update_video.return_value = None
-        mock_db.storage.upload_file.return_value = "uploaded_path"
+        # Drain the streamed chunks as a real upload would
+        mock_db.storage.upload_stream.side_effect = lambda path, chunks: [*chunks] and path
         
         # Mock yt-dlp
         with patch('yt_dlp.YoutubeDL') as mock_ydl:
-            mock_ydl.return_value.__enter__.return_value.extract_info.side_effect = [
-                {"title": "Test Video", "duration": 120},  # Info extraction
-                {"title": "Test Video", "duration": 120}   # Download
-            ]
-            mock_ydl.return_value.__enter__.return_value.prepare_filename.return_value = "temp_video.mp4"
+            ydl = mock_ydl.return_value.__enter__.return_value
+            ydl.extract_info.return_value = {"title": "Test Video", "duration": 120}
+            ydl.sanitize_info.side_effect = lambda info: info
             
-            with patch('os.path.getsize', return_value=1024000), \
-                 patch('os.path.exists', return_value=True), \
-                 patch('os.remove'), \
-                 patch('builtins.open', create=True) as mock_open:
-                mock_open.return_value.__enter__.return_value.read.return_value = b"video data"
+            # Mock the yt-dlp | ffmpeg pipeline
+            with patch('workers.video_processor.subprocess.Popen') as mock_popen:
+                mock_popen.return_value.stdout.read.side_effect = [b"video data", b""]
+                mock_popen.return_value.returncode = 0
                 
                 # Run download
                 download_youtube_video("test-video-id", "https://youtube.com/watch?v=test")
                 
-                # Verify database update
-                mock_db.update_video.assert_called()
+                # Info is extracted once and the stream goes straight to storage
+                ydl.extract_info.assert_called_once()
+                mock_db.storage.upload_stream.assert_called_once()
+                updates = mock_db.update_video.call_args_list[0][0][1]
+                assert updates["file_size"] == len(b"video data")
+                assert updates["duration"] == 120
 
 def test_video_processor_file_processing():
     """Test video file processing."""
@@ -202,21 +216,19 @@ def test_video_processor_file_processing():
             "file_path": "videos/test.mp4"
         }
         mock_db.update_video.return_value = None
-        mock_db.storage.download_file.return_value = b"video data"
+        mock_db.storage.create_signed_url.return_value = "https://storage.example/videos/test.mp4"
         
-        with patch('moviepy.editor.VideoFileClip') as mock_clip:
-            mock_clip.return_value.__enter__.return_value.duration = 120.0
-            mock_clip.return_value.__enter__.return_value.w = 1920
-            mock_clip.return_value.__enter__.return_value.h = 1080
+        # Mock ffprobe
+        with patch('workers.video_processor.probe_video') as mock_probe:
+            mock_probe.return_value = {"duration": 120.0, "width": 1920, "height": 1080, "fps": 30.0}
             
-            with patch('tempfile.NamedTemporaryFile') as mock_temp:
-                mock_temp.return_value.__enter__.return_value.name = "temp_file.mp4"
-                
-                # Run processing
-                process_video("test-video-id")
-                
-                # Verify database update
-                mock_db.update_video.assert_called()
+            # Run processing
+            process_video("test-video-id")
+            
+            # Metadata is probed from the signed URL, without a download
+            mock_probe.assert_called_once_with("https://storage.example/videos/test.mp4")
+            mock_db.storage.download_file_to.assert_not_called()
+            assert mock_db.update_video.call_args_list[0][0][1]["duration"] == 120.0
 
 def test_highlight_detector_viral_keyword_scoring():
     """Test viral keyword scoring in highlight detection."""
@@ -311,3 +323,189 @@ def test_worker_error_handling(mock_database):
     error_calls = [call for call in mock_database.update_job.call_args_list 
                   if 'error_message' in call[0][1]]
     assert len(error_calls) > 0
+
+def test_script_generator_sentence_scoring():
+    """Test batched sentence importance scoring."""
+    from workers.ai.script_generator import score_sentences
+    
+    scores = score_sentences([
+        "The shocking secret truth revealed: 3 amazing tricks that are the best ever?",
+        "This is a normal sentence about nothing much",
+        ""
+    ])
+    
+    assert len(scores) == 3
+    assert scores[0] == 1.0  # Capped at 1.0
+    assert abs(scores[1] - 0.1) < 1e-9  # Only the length bonus
+    assert scores[2] == 0.0
+
+def test_video_editor_smart_crop_filter():
+    """Test the sendcmd crop built from face-tracking regions."""
+    from workers.video_editor import build_smart_crop_filter
+    
+    # Keyframes every second, given out of order; the window stops moving at 6s
+    xs = [0, 10, 20, 30, 40, 50, 60, 60, 80, 90, 100]
+    regions = [
+        {"timestamp": float(t), "x": xs[t], "y": 0, "width": 608, "height": 1080}
+        for t in reversed(range(len(xs)))
+    ]
+    
+    with patch('workers.video_editor.SMART_CROP_SIGMA', 0):
+        crop_filter, script_path = build_smart_crop_filter(regions, 3.5, 3.0)
+    try:
+        with open(script_path) as script:
+            commands = script.read()
+    finally:
+        os.remove(script_path)
+    
+    # Only the keyframes around 3.5-6.5s are used, one either side of the clip
+    assert crop_filter == f"sendcmd=f='{script_path}',crop@smart=608:1080:30:0"
+    assert commands == (
+        "0.000 crop@smart x 30, crop@smart y 0;\n"
+        "0.500 crop@smart x 40, crop@smart y 0;\n"
+        "1.500 crop@smart x 50, crop@smart y 0;\n"
+        "2.500 crop@smart x 60, crop@smart y 0;\n"
+    )
+    
+    # Without regions the caller falls back to the centred crop
+    assert build_smart_crop_filter([], 0.0, 10.0) is None
+
+def test_highlight_detector_select_non_overlapping():
+    """Test highlight selection against the original greedy loop."""
+    import numpy as np
+    from workers.highlight_detector import select_non_overlapping
+    
+    def greedy(starts, ends, scores, max_count):
+        selected = []
+        for i in sorted(range(len(scores)), key=lambda i: scores[i], reverse=True):
+            if len(selected) >= max_count:
+                break
+            if not any(starts[i] < ends[j] and ends[i] > starts[j] for j in selected):
+                selected.append(i)
+        return selected
+    
+    # Equal scores keep their input order
+    starts, ends = np.array([0.0, 10.0, 20.0, 30.0]), np.array([10.0, 20.0, 30.0, 40.0])
+    assert select_non_overlapping(starts, ends, np.array([1.0, 2.0, 2.0, 1.0]), 4) == [1, 2, 0, 3]
+    
+    # Overlapping lower-scored clips are rejected; touching ones are not overlaps
+    starts, ends = np.array([0.0, 5.0, 10.0, 15.0]), np.array([10.0, 15.0, 20.0, 25.0])
+    assert select_non_overlapping(starts, ends, np.array([1.0, 3.0, 2.0, 0.5]), 5) == [1, 3]
+    assert select_non_overlapping(starts, ends, np.array([1.0, 3.0, 2.0, 0.5]), 1) == [1]
+    assert select_non_overlapping(starts, ends, np.array([1.0, 3.0, 2.0, 0.5]), 0) == []
+    
+    rng = np.random.default_rng(0)
+    for _ in range(50):
+        starts = rng.integers(0, 100, size=30).astype(np.float64)
+        ends = starts + rng.integers(5, 30, size=30)
+        scores = rng.integers(0, 5, size=30).astype(np.float64)  # Plenty of ties
+        assert select_non_overlapping(starts, ends, scores, 5) == greedy(starts, ends, scores, 5)
+
+def test_video_editor_ass_subtitles():
+    """Test ASS timestamp rounding and subtitle text escaping."""
+    from workers.video_editor import format_ass_timestamp, build_ass_file
+    
+    assert format_ass_timestamp(0) == "0:00:00.00"
+    assert format_ass_timestamp(61.5) == "0:01:01.50"
+    # Rounding up carries into the next second, minute and hour
+    assert format_ass_timestamp(59.995) == "0:01:00.00"
+    assert format_ass_timestamp(3599.995) == "1:00:00.00"
+    
+    ass_path = build_ass_file(
+        [{"start": 0.0, "end": 59.995, "text": "Use {\\b1} tags\nnow"}], 1080, 1920
+    )
+    try:
+        with open(ass_path, encoding="utf-8") as ass_file:
+            lines = ass_file.read().splitlines()
+    finally:
+        os.remove(ass_path)
+    
+    assert "PlayResX: 1080" in lines
+    assert "PlayResY: 1920" in lines
+    # Braces and backslashes would otherwise be parsed as override tags
+    assert lines[-1] == "Dialogue: 0,0:00:00.00,0:01:00.00,Default,,0,0,0,,Use (/b1) tags now"
+
+def test_progress_reporter_coalesces_writes():
+    """Test that progress updates are batched and finish() supersedes them."""
+    import time
+    from shared.progress import ProgressReporter
+    
+    db = Mock()
+    reporter = ProgressReporter(db, "test-job-id", interval=0.05)
+    
+    # Several updates inside one interval become a single write of the latest values
+    reporter.set(10)
+    reporter.set(20, stage="transcribing")
+    reporter.set(30)
+    db.update_job.assert_not_called()
+    time.sleep(0.3)
+    db.update_job.assert_called_once()
+    job_id, updates = db.update_job.call_args[0]
+    assert job_id == "test-job-id"
+    assert updates["progress"] == 30
+    assert updates["stage"] == "transcribing"
+    
+    # finish() writes at once, merged over pending progress, and cancels the timer
+    db.reset_mock()
+    reporter.set(50)
+    reporter.finish({"status": "completed", "progress": 100})
+    db.update_job.assert_called_once()
+    assert db.update_job.call_args[0][1]["status"] == "completed"
+    assert db.update_job.call_args[0][1]["progress"] == 100
+    time.sleep(0.3)
+    db.update_job.assert_called_once()
+
+def test_highlight_detector_text_result_cache():
+    """Test result order, deduplication, eviction and failure handling in the NLP cache."""
+    from workers.highlight_detector import TextResultCache
+    
+    calls = []
+    
+    def compute(texts):
+        calls.append(list(texts))
+        return [None if text == "fails" else text.upper() for text in texts]
+    
+    cache = TextResultCache(maxsize=2)
+    
+    # Repeated texts are computed once; results follow the input order
+    assert cache.map(["a", "b", "a"], compute) == ["A", "B", "A"]
+    assert calls == [["a", "b"]]
+    assert cache.map(["b", "a"], compute) == ["B", "A"]
+    assert len(calls) == 1
+    
+    # "a" was used last, so adding "c" evicts "b"
+    assert cache.map(["c"], compute) == ["C"]
+    assert cache.map(["a", "b", "c"], compute) == ["A", "B", "C"]
+    assert calls[-1] == ["b"]
+    
+    # Failed results are returned but not cached
+    assert cache.map(["fails"], compute) == [None]
+    assert cache.map(["fails"], compute) == [None]
+    assert calls[-2:] == [["fails"], ["fails"]]
+
+def test_media_probe_video():
+    """Test ffprobe parsing of rotated, NTSC-rate video."""
+    import json
+    from workers.media import probe_video
+    
+    probe_output = {
+        "streams": [
+            {
+                "codec_type": "video", "width": 1920, "height": 1080,
+                "avg_frame_rate": "30000/1001", "r_frame_rate": "30000/1001",
+                "side_data_list": [{"rotation": -90}]
+            },
+            {"codec_type": "audio"}
+        ],
+        "format": {"duration": "12.5"}
+    }
+    
+    with patch('workers.media.subprocess.run') as mock_run:
+        mock_run.return_value = Mock(returncode=0, stdout=json.dumps(probe_output).encode())
+        metadata = probe_video("video.mp4")
+    
+    # Phone footage recorded sideways is reported at its displayed size
+    assert (metadata["width"], metadata["height"]) == (1080, 1920)
+    assert metadata["fps"] == pytest.approx(29.97, abs=0.001)
+    assert metadata["duration"] == 12.5
+    assert metadata["has_audio"] is True
@@ -3,20 +3,34 @@ AI Script Generation Service
 Generates engaging scripts from video transcriptions with platform-specific optimization
 """
 
+import os
+import sys
 import re
 import json
+import asyncio
+import threading
+import hashlib
+import zlib
+from functools import lru_cache
+from collections import OrderedDict
 from typing import List, Dict, Any, Optional, Tuple
 from dataclasses import dataclass
+from types import SimpleNamespace
 from datetime import datetime
 
+import numpy as np
 import openai
-from transformers import pipeline, AutoTokenizer, AutoModelForSequenceClassification
+from transformers import pipeline
 from keybert import KeyBERT
-from textblob import TextBlob
 import nltk
 from nltk.corpus import stopwords
 from nltk.tokenize import sent_tokenize, word_tokenize
 
+# Add the workers directory to path for the shared model loader
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from nlp import load_text_classifier
+
 # Download required NLTK data
 try:
     nltk.data.find('tokenizers/punkt')
@@ -28,6 +42,164 @@ try:
 except LookupError:
     nltk.download('stopwords')
 
+_STOPWORDS = frozenset(stopwords.words('english'))
+
+# Sentences are scored in batches so one forward pass covers many inputs
+PIPELINE_BATCH_SIZE = 32
+
+# Directories holding int8-quantized ONNX exports of the classifiers, created with
+# `optimum-cli export onnx` followed by `optimum-cli onnxruntime quantize`
+SENTIMENT_ONNX_DIR = os.environ.get('SENTIMENT_ONNX_DIR')
+EMOTION_ONNX_DIR = os.environ.get('EMOTION_ONNX_DIR')
+
+SYSTEM_PROMPT_TEMPLATE = """You are an expert social media content creator specializing in viral {platform} content.
+        
+Platform Style: {style}
+Content Length: {length}
+Engagement Strategy: {engagement}
+Content Structure: {structure}
+
+Your task is to transform the provided video transcription into an engaging, viral-ready script optimized for {platform}.
+
+Key Requirements:
+1. Create a compelling hook within the first 3 seconds
+2. Maintain high engagement throughout
+3. Include natural transitions between key points
+4. End with a strong call-to-action
+5. Use the platform's specific language and style
+6. Incorporate trending elements when appropriate
+"""
+
+# Classifier inputs are truncated by the tokenizer to the models' token limit
+CLASSIFIER_TOKENIZER_KWARGS = {'truncation': True, 'max_length': 512}
+
+# Number of transcripts whose analysis results are kept in memory
+ANALYSIS_CACHE_SIZE = 64
+
+# KeyBERT settings for transcript-level keyword extraction
+TRANSCRIPT_NGRAM_RANGE = (1, 3)
+
+# Single-pass tokenizers for counting words and sentences
+_WORD_RE = re.compile(r"\b\w+\b")
+_SENT_RE = re.compile(r'(?<=[.!?])\s+')
+
+# Word lists used to score a sentence's viral potential
+EMOTIONAL_WORDS = ('amazing', 'incredible', 'shocking', 'unbelievable', 'secret', 'truth', 'revealed')
+SUPERLATIVE_WORDS = ('best', 'worst', 'most', 'least', 'first', 'last', 'only', 'never', 'always')
+_DIGIT_RE = re.compile(r'\d')
+
+# Minimum importance score for a sentence to count as a highlight
+HIGHLIGHT_THRESHOLD = 0.6
+
+def score_sentences(sentences: List[str], sentences_lower: Optional[List[str]] = None) -> np.ndarray:
+    """Score the viral potential of every sentence in one vectorized pass"""
+    
+    if sentences_lower is None:
+        sentences_lower = [sentence.lower() for sentence in sentences]
+    
+    count = len(sentences)
+    emotional_hits = np.zeros(count)
+    superlative_hits = np.zeros(count)
+    has_digit = np.zeros(count, dtype=bool)
+    has_question = np.zeros(count, dtype=bool)
+    word_counts = np.zeros(count, dtype=np.int32)
+    
+    # Gather raw features; the scoring itself is done on whole arrays below
+    for i, (sentence, sentence_lower) in enumerate(zip(sentences, sentences_lower)):
+        emotional_hits[i] = sum(word in sentence_lower for word in EMOTIONAL_WORDS)
+        superlative_hits[i] = sum(word in sentence_lower for word in SUPERLATIVE_WORDS)
+        has_digit[i] = _DIGIT_RE.search(sentence) is not None
+        has_question[i] = '?' in sentence
+        word_counts[i] = len(sentence.split())
+    
+    scores = 0.1 * emotional_hits + 0.1 * superlative_hits
+    scores += np.where(has_digit, 0.2, 0.0)  # Specific data points are engaging
+    scores += np.where(has_question, 0.15, 0.0)
+    
+    # Sentence length bonus/penalty (too long or too short)
+    scores += np.where((word_counts >= 5) & (word_counts <= 20), 0.1, 0.0)
+    scores -= np.where(word_counts > 30, 0.2, 0.0)
+    
+    return np.minimum(scores, 1.0)
+
+# Indicators used to classify a sentence's role in a script
+HOOK_INDICATORS = ("you won't believe", 'this changed', 'secret', 'nobody talks', "most people don't")
+CTA_INDICATORS = ('comment', 'like', 'subscribe', 'share', 'follow', 'let me know', 'tell me')
+TRANSITION_INDICATORS = ('but', 'however', 'now', 'next', "here's", 'so')
+
+PhraseMatcher = Tuple["re.Pattern[str]", Dict[str, str]]
+
+def build_phrase_matcher(categories: Dict[str, List[str]]) -> PhraseMatcher:
+    """Compile every phrase into one alternation tagged with its category"""
+    
+    lookup: Dict[str, str] = {}
+    for category, phrases in categories.items():
+        for phrase in phrases:
+            lookup.setdefault(phrase.lower(), category)
+    
+    # Longest phrases first so a short phrase never shadows a longer one
+    alternation = '|'.join(re.escape(phrase) for phrase in sorted(lookup, key=len, reverse=True))
+    return re.compile(alternation), lookup
+
+def match_categories(matcher: PhraseMatcher, text_lower: str) -> set:
+    """Return the categories of all phrases found in a single scan of the text"""
+    
+    pattern, lookup = matcher
+    return {lookup[match.group(0)] for match in pattern.finditer(text_lower)}
+
+_SENTENCE_TYPE_MATCHER = build_phrase_matcher({
+    'hook': HOOK_INDICATORS,
+    'cta': CTA_INDICATORS
+})
+
+@lru_cache(maxsize=256)
+def _title_for_keyword(keyword: str) -> str:
+    """Pick a title template deterministically from the lead keyword"""
+    
+    topic = keyword.title()
+    title_templates = [
+        f"The Truth About {topic}",
+        f"How {topic} Changed Everything",
+        f"Why Everyone's Talking About {topic}",
+        f"The {topic} Secret Nobody Tells You",
+        f"This {topic} Trick Will Blow Your Mind"
+    ]
+    
+    # crc32 rather than hash() so the choice is stable across processes
+    return title_templates[zlib.crc32(keyword.encode('utf-8')) % len(title_templates)]
+
+# Deletes every ASCII character that is not a letter or digit; non-ASCII
+# characters are dropped by an ascii encode before translating
+_HASHTAG_TABLE = str.maketrans('', '', ''.join(
+    chr(code) for code in range(128) if not chr(code).isalnum()
+))
+
+def _content_key(text: str) -> str:
+    """Stable content hash used to key per-text caches"""
+    return hashlib.blake2b(text.encode('utf-8'), digest_size=16).hexdigest()
+
+class _LRUCache:
+    """Small thread-safe LRU map; analysis runs in worker threads"""
+    
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._data: "OrderedDict[str, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get(self, key: str) -> Any:
+        with self._lock:
+            value = self._data.get(key)
+            if value is not None:
+                self._data.move_to_end(key)
+            return value
+    
+    def put(self, key: str, value: Any) -> None:
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            if len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
 @dataclass
 class ScriptSection:
     start_time: float
@@ -50,32 +222,52 @@ class GeneratedScript:
     ctas: List[str]
     timestamps: List[ScriptSection]
 
+@lru_cache(maxsize=1)
+def _shared_models() -> SimpleNamespace:
+    """Load the NLP models once per process and share them between generators"""
+    
+    keybert = KeyBERT()
+    
+    # Initialize sentiment analysis
+    try:
+        sentiment_analyzer = load_text_classifier(
+            "sentiment-analysis",
+            "cardiffnlp/twitter-roberta-base-sentiment-latest",
+            SENTIMENT_ONNX_DIR,
+            return_all_scores=True,
+            batch_size=PIPELINE_BATCH_SIZE
+        )
+    except Exception:
+        # Fallback to a simpler model
+        sentiment_analyzer = pipeline("sentiment-analysis", batch_size=PIPELINE_BATCH_SIZE)
+    
+    # Initialize emotion detection
+    try:
+        emotion_analyzer = load_text_classifier(
+            "text-classification",
+            "j-hartmann/emotion-english-distilroberta-base",
+            EMOTION_ONNX_DIR,
+            return_all_scores=True,
+            batch_size=PIPELINE_BATCH_SIZE
+        )
+    except Exception:
+        emotion_analyzer = None
+    
+    return SimpleNamespace(
+        keybert=keybert,
+        sentiment_analyzer=sentiment_analyzer,
+        emotion_analyzer=emotion_analyzer
+    )
+
 class ScriptGenerator:
     def __init__(self):
-        # Initialize AI models
-        self.openai_client = openai.OpenAI()
-        self.keybert = KeyBERT()
-        
-        # Initialize sentiment analysis
-        try:
-            self.sentiment_analyzer = pipeline(
-                "sentiment-analysis",
-                model="cardiffnlp/twitter-roberta-base-sentiment-latest",
-                return_all_scores=True
-            )
-        except Exception:
-            # Fallback to a simpler model
-            self.sentiment_analyzer = pipeline("sentiment-analysis")
-        
-        # Initialize emotion detection
-        try:
-            self.emotion_analyzer = pipeline(
-                "text-classification",
-                model="j-hartmann/emotion-english-distilroberta-base",
-                return_all_scores=True
-            )
-        except Exception:
-            self.emotion_analyzer = None
+        # Initialize AI models; the heavy ones are loaded once per process
+        self.openai_client = openai.AsyncOpenAI()
+        models = _shared_models()
+        self.keybert = models.keybert
+        self.sentiment_analyzer = models.sentiment_analyzer
+        self.emotion_analyzer = models.emotion_analyzer
+        self._analysis_cache = _LRUCache(ANALYSIS_CACHE_SIZE)
         
         # Platform-specific prompts
         self.platform_prompts = {
@@ -146,6 +338,17 @@ class ScriptGenerator:
                 "What's your experience with this?"
             ]
         }
+        self._viral_matcher = build_phrase_matcher({
+            'hook': self.viral_keywords['hooks'],
+            'cta': self.viral_keywords['cta_phrases'],
+            'transition': self.viral_keywords['transition_phrases']
+        })
+        
+        # The system prompt only depends on the platform, so render it up front
+        self._system_prompts = {
+            platform: SYSTEM_PROMPT_TEMPLATE.format(platform=platform, **config)
+            for platform, config in self.platform_prompts.items()
+        }
 
     async def generate_script(
         self,
@@ -157,21 +360,30 @@ class ScriptGenerator:
     ) -> GeneratedScript:
         """Generate an engaging script from video transcription"""
         
+        # Split the transcript into sentences once for every step below
+        sentences = sent_tokenize(transcription_text)
+        
         # Step 1: Analyze the transcription
-        analysis = await self._analyze_transcription(transcription_text)
+        analysis = await self._analyze_transcription(transcription_text, sentences)
         
         # Step 2: Extract key moments and highlights
-        highlights = await self._extract_highlights(transcription_text, video_duration)
-        
-        # Step 3: Generate platform-optimized script
-        script_content = await self._generate_platform_script(
-            transcription_text, analysis, highlights, platform, custom_prompt
+        highlights = await self._extract_highlights(transcription_text, video_duration, sentences)
+        
+        # Step 3: Start the platform-optimized script; it is the long pole,
+        # so the independent steps below run while it is in flight
+        script_task = asyncio.create_task(self._generate_platform_script(
+            transcription_text, analysis, highlights, platform, custom_prompt, sentences
+        ))
+        
+        # Step 4: Generate hashtags, hooks, CTAs and title
+        hashtags, hooks, ctas, title = await asyncio.gather(
+            self._generate_hashtags(analysis['keywords'], platform),
+            self._generate_hooks(analysis['keywords'], platform),
+            self._generate_ctas(platform),
+            self._generate_title(analysis['keywords'], platform)
         )
         
-        # Step 4: Generate hashtags and CTAs
-        hashtags = await self._generate_hashtags(analysis['keywords'], platform)
-        ctas = await self._generate_ctas(platform)
-        hooks = await self._generate_hooks(analysis['keywords'], platform)
+        script_content = await script_task
         
         # Step 5: Create timestamps if requested
         timestamps = []
@@ -184,7 +396,7 @@ class ScriptGenerator:
         )
         
         return GeneratedScript(
-            title=await self._generate_title(analysis['keywords'], platform),
+            title=title,
             content=script_content,
             platform_optimization=platform,
             engagement_score=engagement_score,
@@ -196,132 +408,123 @@ class ScriptGenerator:
             timestamps=timestamps
         )
 
-    async def _analyze_transcription(self, text: str) -> Dict[str, Any]:
+    async def _analyze_transcription(self, text: str, sentences: Optional[List[str]] = None) -> Dict[str, Any]:
         """Analyze transcription for sentiment, keywords, and key themes"""
         
+        # Results are deterministic for a given text, so cache them by content hash
+        key = _content_key(text)
+        analysis = self._analysis_cache.get(key)
+        if analysis is None:
+            # Model inference is blocking; keep it off the event loop
+            analysis = await asyncio.to_thread(self._run_analysis, text)
+            self._analysis_cache.put(key, analysis)
+        
+        # Callers may split the same text into sentences differently, so the
+        # count stays outside the cached, text-keyed results
+        sentence_count = len(sentences) if sentences is not None else len([s for s in _SENT_RE.split(text.strip()) if s])
+        return {**analysis, 'keywords': list(analysis['keywords']), 'sentence_count': sentence_count}
+
+    def _run_analysis(self, text: str) -> Dict[str, Any]:
+        """Run the keyword, sentiment and emotion models over a transcription"""
+        
         # Extract keywords using KeyBERT
         keywords = self.keybert.extract_keywords(
             text, 
-            keyphrase_ngram_range=(1, 3), 
+            keyphrase_ngram_range=TRANSCRIPT_NGRAM_RANGE, 
             stop_words='english',
-            top_k=15
+            top_n=15
         )
         keyword_list = [kw[0] for kw in keywords]
         
         # Sentiment analysis
-        sentiment_result = self.sentiment_analyzer(text[:512])  # Truncate for model limits
+        sentiment_result = self.sentiment_analyzer(text, **CLASSIFIER_TOKENIZER_KWARGS)
         if isinstance(sentiment_result[0], list):
             # Multiple scores returned
             sentiment_scores = {item['label'].lower(): item['score'] for item in sentiment_result[0]}
             overall_sentiment = max(sentiment_scores, key=sentiment_scores.get)
             sentiment_score = sentiment_scores.get('positive', 0) - sentiment_scores.get('negative', 0)
+            subjectivity = 1.0 - sentiment_scores.get('neutral', 0)
         else:
             # Single score returned
             overall_sentiment = sentiment_result[0]['label'].lower()
             sentiment_score = sentiment_result[0]['score'] if 'positive' in overall_sentiment else -sentiment_result[0]['score']
+            subjectivity = abs(sentiment_score)
         
         # Emotion analysis if available
         emotions = {}
         if self.emotion_analyzer:
             try:
-                emotion_result = self.emotion_analyzer(text[:512])
+                emotion_result = self.emotion_analyzer(text, **CLASSIFIER_TOKENIZER_KWARGS)
+                if emotion_result and isinstance(emotion_result[0], list):
+                    emotion_result = emotion_result[0]
                 emotions = {item['label']: item['score'] for item in emotion_result}
             except Exception:
                 emotions = {}
         
-        # TextBlob analysis for additional insights
-        blob = TextBlob(text)
-        
+        # Polarity and subjectivity come from the sentiment model scores
+        # rather than a separate TextBlob pass over the text
         return {
             'keywords': keyword_list,
             'sentiment_score': sentiment_score,
             'overall_sentiment': overall_sentiment,
             'emotions': emotions,
-            'polarity': blob.sentiment.polarity,
-            'subjectivity': blob.sentiment.subjectivity,
-            'word_count': len(word_tokenize(text)),
-            'sentence_count': len(sent_tokenize(text))
+            'polarity': sentiment_score,
+            'subjectivity': subjectivity,
+            'word_count': len(_WORD_RE.findall(text))
         }
 
-    async def _extract_highlights(self, text: str, duration: float) -> List[Dict[str, Any]]:
-        """Extract key moments and highlights from transcription"""
+    async def _extract_highlights(
+        self,
+        text: str,
+        duration: float,
+        sentences: Optional[List[str]] = None
+    ) -> Dict[str, Any]:
+        """Extract key moments and highlights from transcription
         
-        sentences = sent_tokenize(text)
-        highlights = []
+        Highlights are returned as parallel fields, best first: NumPy arrays
+        'start_times', 'end_times' and 'scores', plus 'contents' and 'types' lists.
+        """
+        
+        if sentences is None:
+            sentences = sent_tokenize(text)
         
         # Estimate time per sentence (rough calculation)
         time_per_sentence = duration / len(sentences) if sentences else 1
         
-        # Analyze each sentence for viral potential
-        for i, sentence in enumerate(sentences):
-            start_time = i * time_per_sentence
-            end_time = (i + 1) * time_per_sentence
-            
-            # Calculate importance score
-            importance_score = await self._calculate_sentence_importance(sentence)
-            
-            if importance_score > 0.6:  # Threshold for highlights
-                highlights.append({
-                    'start_time': start_time,
-                    'end_time': end_time,
-                    'content': sentence,
-                    'importance_score': importance_score,
-                    'type': await self._classify_sentence_type(sentence)
-                })
-        
-        # Sort by importance and return top highlights
-        highlights.sort(key=lambda x: x['importance_score'], reverse=True)
-        return highlights[:10]  # Return top 10 highlights
-
-    async def _calculate_sentence_importance(self, sentence: str) -> float:
-        """Calculate the viral potential of a sentence"""
-        
-        score = 0.0
-        sentence_lower = sentence.lower()
-        
-        # Check for emotional words
-        emotional_words = ['amazing', 'incredible', 'shocking', 'unbelievable', 'secret', 'truth', 'revealed']
-        score += sum(0.1 for word in emotional_words if word in sentence_lower)
-        
-        # Check for numbers (specific data points are engaging)
-        if re.search(r'\d+', sentence):
-            score += 0.2
-        
-        # Check for question marks (engagement)
-        if '?' in sentence:
-            score += 0.15
-        
-        # Check for superlatives
-        superlatives = ['best', 'worst', 'most', 'least', 'first', 'last', 'only', 'never', 'always']
-        score += sum(0.1 for word in superlatives if word in sentence_lower)
+        # Score every sentence at once; each sentence is lowercased once and
+        # shared by scoring and classification
+        sentences_lower = [sentence.lower() for sentence in sentences]
+        scores = score_sentences(sentences, sentences_lower)
         
-        # Sentence length penalty (too long or too short)
-        word_count = len(sentence.split())
-        if 5 <= word_count <= 20:
-            score += 0.1
-        elif word_count > 30:
-            score -= 0.2
+        # Keep the top 10 above the threshold; a stable sort keeps ties in transcript order
+        candidates = np.flatnonzero(scores > HIGHLIGHT_THRESHOLD)
+        top = candidates[np.argsort(-scores[candidates], kind='stable')][:10]
         
-        return min(score, 1.0)
+        return {
+            'start_times': top * time_per_sentence,
+            'end_times': (top + 1) * time_per_sentence,
+            'scores': scores[top],
+            'contents': [sentences[i] for i in top.tolist()],
+            'types': [
+                await self._classify_sentence_type(sentences[i], sentences_lower[i])
+                for i in top.tolist()
+            ]
+        }
 
-    async def _classify_sentence_type(self, sentence: str) -> str:
+    async def _classify_sentence_type(self, sentence: str, sentence_lower: Optional[str] = None) -> str:
         """Classify sentence as hook, content, cta, or transition"""
         
-        sentence_lower = sentence.lower()
+        if sentence_lower is None:
+            sentence_lower = sentence.lower()
+        found = match_categories(_SENTENCE_TYPE_MATCHER, sentence_lower)
         
-        # Hook indicators
-        hook_indicators = ['you won\'t believe', 'this changed', 'secret', 'nobody talks', 'most people don\'t']
-        if any(indicator in sentence_lower for indicator in hook_indicators):
+        if 'hook' in found:
             return 'hook'
         
-        # CTA indicators
-        cta_indicators = ['comment', 'like', 'subscribe', 'share', 'follow', 'let me know', 'tell me']
-        if any(indicator in sentence_lower for indicator in cta_indicators):
+        if 'cta' in found:
             return 'cta'
         
-        # Transition indicators
-        transition_indicators = ['but', 'however', 'now', 'next', 'here\'s', 'so']
-        if sentence_lower.startswith(tuple(transition_indicators)):
+        if sentence_lower.startswith(TRANSITION_INDICATORS):
             return 'transition'
         
         return 'content'
@@ -330,39 +533,24 @@ class ScriptGenerator:
         self,
         transcription: str,
         analysis: Dict[str, Any],
-        highlights: List[Dict[str, Any]],
+        highlights: Dict[str, Any],
         platform: str,
-        custom_prompt: Optional[str] = None
+        custom_prompt: Optional[str] = None,
+        sentences: Optional[List[str]] = None
     ) -> str:
         """Generate platform-optimized script using OpenAI"""
         
-        platform_config = self.platform_prompts.get(platform, self.platform_prompts['general'])
-        
-        # Build the prompt
-        system_prompt = f"""You are an expert social media content creator specializing in viral {platform} content.
-        
-Platform Style: {platform_config['style']}
-Content Length: {platform_config['length']}
-Engagement Strategy: {platform_config['engagement']}
-Content Structure: {platform_config['structure']}
-
-Your task is to transform the provided video transcription into an engaging, viral-ready script optimized for {platform}.
-
-Key Requirements:
-1. Create a compelling hook within the first 3 seconds
-2. Maintain high engagement throughout
-3. Include natural transitions between key points
-4. End with a strong call-to-action
-5. Use the platform's specific language and style
-6. Incorporate trending elements when appropriate
-"""
+        # System prompts for known platforms are built once in __init__
+        system_prompt = self._system_prompts.get(platform)
+        if system_prompt is None:
+            system_prompt = SYSTEM_PROMPT_TEMPLATE.format(platform=platform, **self.platform_prompts['general'])
         
         user_prompt = f"""
 Original Video Transcription:
 {transcription[:2000]}  # Truncate to avoid token limits
 
 Key Highlights Identified:
-{json.dumps([h['content'] for h in highlights[:5]], indent=2)}
+{json.dumps(highlights['contents'][:5], indent=2)}
 
 Top Keywords: {', '.join(analysis['keywords'][:10])}
 Overall Sentiment: {analysis['overall_sentiment']}
@@ -373,37 +561,49 @@ Please create an engaging {platform} script that will captivate viewers and enco
 """
         
         try:
-            response = await openai.ChatCompletion.acreate(
+            response = await self.openai_client.chat.completions.create(
                 model="gpt-3.5-turbo",
                 messages=[
                     {"role": "system", "content": system_prompt},
                     {"role": "user", "content": user_prompt}
                 ],
                 max_tokens=800,
-                temperature=0.7
+                temperature=0.7,
+                stream=True
             )
             
-            return response.choices[0].message.content.strip()
+            # Consume tokens as they arrive so the event loop keeps running the
+            # local generation steps between network reads
+            parts = []
+            async for chunk in response:
+                if chunk.choices:
+                    parts.append(chunk.choices[0].delta.content or '')
+            
+            return ''.join(parts).strip()
             
         except Exception as e:
             # Fallback to template-based generation
-            return await self._generate_fallback_script(transcription, analysis, platform)
+            return await self._generate_fallback_script(transcription, analysis, platform, sentences)
 
     async def _generate_fallback_script(
         self,
         transcription: str,
         analysis: Dict[str, Any],
-        platform: str
+        platform: str,
+        sentences: Optional[List[str]] = None
     ) -> str:
         """Fallback script generation without OpenAI"""
         
-        sentences = sent_tokenize(transcription)
+        if sentences is None:
+            sentences = sent_tokenize(transcription)
         top_keywords = analysis['keywords'][:5]
         
         # Select best sentences
+        top_keywords_lower = [keyword.lower() for keyword in top_keywords]
         important_sentences = []
         for sentence in sentences[:20]:  # Limit to first 20 sentences
-            if any(keyword.lower() in sentence.lower() for keyword in top_keywords):
+            sentence_lower = sentence.lower()
+            if any(keyword in sentence_lower for keyword in top_keywords_lower):
                 important_sentences.append(sentence)
         
         # Create script structure
@@ -446,7 +646,7 @@ Please create an engaging {platform} script that will captivate viewers and enco
         
         # Add keyword-based hashtags
         for keyword in keywords[:5]:
-            hashtag = re.sub(r'[^a-zA-Z0-9]', '', keyword.replace(' ', ''))
+            hashtag = keyword.encode('ascii', 'ignore').decode('ascii').translate(_HASHTAG_TABLE)
             if hashtag:
                 hashtags.append(f"#{hashtag}")
         
@@ -502,72 +702,100 @@ Please create an engaging {platform} script that will captivate viewers and enco
     async def _create_timestamps(
         self,
         script_content: str,
-        highlights: List[Dict[str, Any]]
+        highlights: Dict[str, Any]
     ) -> List[ScriptSection]:
         """Create timestamp alignment between script and video"""
         
-        script_sentences = sent_tokenize(script_content)
+        # Only sentences that line up with a highlight get a section
+        script_sentences = sent_tokenize(script_content)[:len(highlights['contents'])]
+        sentence_keywords = await self._extract_sentence_keywords(script_sentences)
+        start_times = highlights['start_times'].tolist()
+        end_times = highlights['end_times'].tolist()
+        scores = highlights['scores'].tolist()
         timestamps = []
         
         # Map script sentences to video highlights
-        for i, sentence in enumerate(script_sentences):
-            if i < len(highlights):
-                highlight = highlights[i]
-                section_type = await self._classify_sentence_type(sentence)
-                
-                timestamps.append(ScriptSection(
-                    start_time=highlight['start_time'],
-                    end_time=highlight['end_time'],
-                    section_type=section_type,
-                    content=sentence,
-                    engagement_score=highlight['importance_score'],
-                    keywords=await self._extract_sentence_keywords(sentence)
-                ))
+        for i, (sentence, keywords) in enumerate(zip(script_sentences, sentence_keywords)):
+            section_type = await self._classify_sentence_type(sentence)
+            
+            timestamps.append(ScriptSection(
+                start_time=start_times[i],
+                end_time=end_times[i],
+                section_type=section_type,
+                content=sentence,
+                engagement_score=scores[i],
+                keywords=keywords
+            ))
         
         return timestamps
 
-    async def _extract_sentence_keywords(self, sentence: str) -> List[str]:
-        """Extract keywords from a single sentence"""
+    async def _extract_sentence_keywords(self, sentences: List[str]) -> List[List[str]]:
+        """Extract keywords for each sentence in a single batched KeyBERT call"""
+        
+        if not sentences:
+            return []
         
         try:
             keywords = self.keybert.extract_keywords(
-                sentence,
+                sentences,
                 keyphrase_ngram_range=(1, 2),
                 stop_words='english',
-                top_k=3
+                top_n=3
             )
-            return [kw[0] for kw in keywords]
+            # KeyBERT unwraps the result when given a single document
+            if len(sentences) == 1:
+                keywords = [keywords]
+            return [[kw[0] for kw in sentence_keywords] for sentence_keywords in keywords]
         except:
             # Fallback to simple word extraction
-            words = word_tokenize(sentence.lower())
-            stop_words = set(stopwords.words('english'))
-            return [word for word in words if word not in stop_words and len(word) > 3][:3]
+            return [
+                [word for word in word_tokenize(sentence.lower()) if word not in _STOPWORDS and len(word) > 3][:3]
+                for sentence in sentences
+            ]
+
+    def _script_signals(self, script_lower: str, keywords: List[str]) -> Tuple[set, int]:
+        """Scan a lowercased script once for viral phrase categories and keyword hits"""
+        
+        found = match_categories(self._viral_matcher, script_lower)
+        
+        # Single-word keywords are looked up in the script's token set; only
+        # multi-word phrases still need a substring search
+        script_tokens = set(_WORD_RE.findall(script_lower))
+        keyword_density = 0
+        for keyword in keywords[:5]:
+            keyword_lower = keyword.lower()
+            if ' ' in keyword_lower:
+                keyword_density += keyword_lower in script_lower
+            else:
+                keyword_density += keyword_lower in script_tokens
+        return found, keyword_density
 
     async def _calculate_engagement_score(
         self,
         script: str,
         analysis: Dict[str, Any],
-        platform: str
+        platform: str,
+        signals: Optional[Tuple[set, int]] = None
     ) -> float:
         """Calculate predicted engagement score for the script"""
         
         score = 0.0
-        script_lower = script.lower()
+        if signals is None:
+            signals = self._script_signals(script.lower(), analysis['keywords'])
+        found, keyword_density = signals
         
         # Sentiment boost
         if analysis['sentiment_score'] > 0:
             score += 0.2
         
         # Keyword density
-        keyword_density = sum(1 for keyword in analysis['keywords'][:5] if keyword.lower() in script_lower)
         score += min(keyword_density * 0.1, 0.3)
         
-        # Hook presence
-        if any(hook.lower() in script_lower for hook in self.viral_keywords['hooks']):
+        # Hook and CTA presence
+        if 'hook' in found:
             score += 0.2
         
-        # CTA presence
-        if any(cta.lower() in script_lower for cta in self.viral_keywords['cta_phrases']):
+        if 'cta' in found:
             score += 0.15
         
         # Question presence (engagement)
@@ -588,17 +816,7 @@ Please create an engaging {platform} script that will captivate viewers and enco
         if not keywords:
             return f"Viral {platform.title()} Script"
         
-        title_templates = [
-            f"The Truth About {keywords[0].title()}",
-            f"How {keywords[0].title()} Changed Everything",
-            f"Why Everyone's Talking About {keywords[0].title()}",
-            f"The {keywords[0].title()} Secret Nobody Tells You",
-            f"This {keywords[0].title()} Trick Will Blow Your Mind"
-        ]
-        
-        # Select template based on sentiment
-        import random
-        return random.choice(title_templates)
+        return _title_for_keyword(keywords[0])
 
 class ScriptOptimizer:
     """Optimize existing scripts for better engagement"""
@@ -619,33 +837,34 @@ class ScriptOptimizer:
         
         optimizations = {}
         
-        # Analyze current script
+        # Analyze current script and scan it once for hooks, CTAs and keywords
         analysis = await self.generator._analyze_transcription(original_script)
+        signals = self.generator._script_signals(original_script.lower(), analysis['keywords'])
+        found, keyword_density = signals
         current_score = await self.generator._calculate_engagement_score(
-            original_script, analysis, target_platform
+            original_script, analysis, target_platform, signals
         )
         
         # Suggest improvements
         suggestions = []
         
         # Hook improvement
-        if not any(hook.lower() in original_script.lower() for hook in self.generator.viral_keywords['hooks']):
+        if 'hook' not in found:
             suggestions.append({
                 'type': 'hook',
                 'suggestion': 'Add a stronger opening hook',
-                'example': await self.generator._select_hook(target_platform, analysis['keywords'])
+                'example': self.generator._select_hook(target_platform, analysis['keywords'])
             })
         
         # CTA improvement
-        if not any(cta.lower() in original_script.lower() for cta in self.generator.viral_keywords['cta_phrases']):
+        if 'cta' not in found:
             suggestions.append({
                 'type': 'cta',
                 'suggestion': 'Add a call-to-action',
-                'example': await self.generator._select_cta(target_platform)
+                'example': self.generator._select_cta(target_platform)
             })
         
         # Keyword optimization
-        keyword_density = sum(1 for keyword in analysis['keywords'][:5] if keyword.lower() in original_script.lower())
         if keyword_density < 2:
             suggestions.append({
                 'type': 'keywords',
@@ -689,5 +908,4 @@ async def test_script_generation():
     print(f"Hashtags: {', '.join(script.hashtags)}")
 
 if __name__ == "__main__":
-    import asyncio
     asyncio.run(test_script_generation())
@@ -3,7 +3,9 @@ import sys
 import tempfile
 import json
 from datetime import datetime
-from typing import List, Dict, Any
+from functools import lru_cache
+from typing import List, Dict, Any, Optional, Union
+import numpy as np
 import torch
 try:
     import whisperx
@@ -15,18 +17,69 @@ except ImportError:
 sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'shared'))
 
 from database import Database
-from utils import generate_id
+from utils import generate_id, get_temp_dir
 from schemas import JobStatus
+from progress import ProgressReporter
+from media import extract_audio_pcm
 
 db = Database()
 
+# WhisperX batch size; lower it on memory-constrained GPUs
+WHISPERX_BATCH_SIZE = int(os.environ.get("WHISPERX_BATCH_SIZE", "16"))
+
+SINGLE_SPEAKER_LABEL = "SPEAKER_00"
+
+# Hugging Face token for the gated pyannote diarization weights
+HF_TOKEN = os.environ.get("HF_TOKEN", "YOUR_HF_TOKEN")
+
+# Models are cached per worker process so back-to-back jobs skip reloading
+# weights onto the device
+@lru_cache(maxsize=2)
+def _load_whisper(model_size: str, device: str, compute_type: str):
+    """Load a WhisperX transcription model."""
+    return whisperx.load_model(model_size, device, compute_type=compute_type)
+
+# Dynamically quantize the wav2vec2 alignment model's linear layers to int8
+# when aligning on CPU; set ALIGN_QUANTIZE_CPU=0 to keep float32
+ALIGN_QUANTIZE_CPU = os.environ.get("ALIGN_QUANTIZE_CPU", "1") != "0"
+
+@lru_cache(maxsize=4)
+def _load_align(language_code: str, device: str):
+    """Load the alignment model for a language."""
+    model_a, metadata = whisperx.load_align_model(language_code=language_code, device=device)
+    if device == "cpu" and ALIGN_QUANTIZE_CPU:
+        model_a = torch.quantization.quantize_dynamic(model_a, {torch.nn.Linear}, dtype=torch.qint8)
+    return model_a, metadata
+
+@lru_cache(maxsize=1)
+def _load_diarize(device: str, token: str):
+    """Load the pyannote diarization pipeline."""
+    return whisperx.DiarizationPipeline(use_auth_token=token, device=device)
+
+def _assign_single_speaker(aligned_result: Dict[str, Any]) -> Dict[str, Any]:
+    """Label every segment and word with one speaker, bypassing diarization."""
+    for segment in aligned_result["segments"]:
+        segment["speaker"] = SINGLE_SPEAKER_LABEL
+        for word in segment.get("words", []):
+            word["speaker"] = SINGLE_SPEAKER_LABEL
+    return aligned_result
+
 class EnhancedTranscription:
     def __init__(self):
         self.device = "cuda" if torch.cuda.is_available() else "cpu"
-        self.compute_type = "float16" if torch.cuda.is_available() else "int8"
+        # int8 weights with fp16 activations on GPU: faster and smaller than plain fp16
+        self.compute_type = "int8_float16" if torch.cuda.is_available() else "int8"
         
-    def transcribe_with_whisperx(self, audio_path: str, video_id: str, job_id: str) -> Dict[str, Any]:
-        """Enhanced transcription with speaker diarization using WhisperX."""
+    def transcribe_with_whisperx(self, audio: Union[str, np.ndarray], video_id: str, job_id: str,
+                                 num_speakers: Optional[int] = None,
+                                 reporter: Optional[ProgressReporter] = None) -> Dict[str, Any]:
+        """Enhanced transcription with speaker diarization using WhisperX.
+
+        ``audio`` is either a file path or 16 kHz mono float32 samples. When
+        ``num_speakers`` is 1 diarization is skipped entirely; any other
+        known count is passed to pyannote as a min/max hint.
+        """
+        reporter = reporter or ProgressReporter(db, job_id)
         try:
             if not WHISPERX_AVAILABLE:
                 raise Exception("WhisperX not available")
@@ -34,81 +87,68 @@ class EnhancedTranscription:
             print(f"Starting WhisperX transcription for video {video_id}")
             
             # Update progress
-            db.update_job(job_id, {
-                "progress": 20,
-                "updated_at": datetime.utcnow().isoformat()
-            })
+            reporter.set(20)
             
-            # Load WhisperX model
-            model = whisperx.load_model("base", self.device, compute_type=self.compute_type)
+            # Load WhisperX model (cached per process)
+            model = _load_whisper("base", self.device, self.compute_type)
             
-            # Load audio
-            audio = whisperx.load_audio(audio_path)
+            # Load audio unless already decoded
+            if isinstance(audio, str):
+                audio = whisperx.load_audio(audio)
             
-            # Transcribe with WhisperX
-            result = model.transcribe(audio, batch_size=16)
+            # Transcribe with WhisperX's batched pipeline
+            result = model.transcribe(audio, batch_size=WHISPERX_BATCH_SIZE)
             
             # Update progress
-            db.update_job(job_id, {
-                "progress": 40,
-                "updated_at": datetime.utcnow().isoformat()
-            })
+            reporter.set(40)
             
-            # Load alignment model
-            model_a, metadata = whisperx.load_align_model(
-                language_code=result["language"], 
-                device=self.device
-            )
+            # Load alignment model (cached per language)
+            model_a, metadata = _load_align(result["language"], self.device)
             
             # Align whisper output
             aligned_result = whisperx.align(result["segments"], model_a, metadata, audio, self.device, return_char_alignments=False)
             
             # Update progress
-            db.update_job(job_id, {
-                "progress": 60,
-                "updated_at": datetime.utcnow().isoformat()
-            })
-            
-            # Assign speaker labels using diarization
-            diarize_model = whisperx.DiarizationPipeline(use_auth_token="YOUR_HF_TOKEN", device=self.device)
-            diarize_segments = diarize_model(audio)
+            reporter.set(60)
             
-            # Assign speakers to segments
-            final_result = whisperx.assign_word_speakers(diarize_segments, aligned_result)
+            if num_speakers == 1:
+                # Single speaker: no need to load or run pyannote
+                final_result = _assign_single_speaker(aligned_result)
+            else:
+                # Assign speaker labels using diarization
+                diarize_model = _load_diarize(self.device, HF_TOKEN)
+                diarize_segments = diarize_model(audio, min_speakers=num_speakers, max_speakers=num_speakers)
+                
+                # Assign speakers to segments
+                final_result = whisperx.assign_word_speakers(diarize_segments, aligned_result)
             
             # Update progress
-            db.update_job(job_id, {
-                "progress": 80,
-                "updated_at": datetime.utcnow().isoformat()
-            })
+            reporter.set(80)
             
-            # Process segments for database storage
-            processed_segments = []
-            full_text = ""
-            
-            for segment in final_result["segments"]:
-                segment_data = {
+            # Process segments for database storage, with word-level speaker info
+            processed_segments = [
+                {
                     "start": segment["start"],
                     "end": segment["end"],
                     "text": segment["text"].strip(),
                     "speaker": segment.get("speaker", "UNKNOWN"),
-                    "words": []
-                }
-                
-                # Add word-level data with speaker info
-                if "words" in segment:
-                    for word in segment["words"]:
-                        word_data = {
+                    "words": [
+                        {
                             "start": word["start"],
                             "end": word["end"],
                             "word": word["word"],
                             "probability": word.get("probability", 0.5),
                             "speaker": word.get("speaker", segment.get("speaker", "UNKNOWN"))
                         }
-                        segment_data["words"].append(word_data)
-                
-                processed_segments.append(segment_data)
-                full_text += f"[{segment_data['speaker']}] {segment['text']} "
+                        for word in segment.get("words", ())
+                    ]
+                }
+                for segment in final_result["segments"]
+            ]
+            full_text = " ".join(
+                f"[{processed['speaker']}] {segment['text']}"
+                for processed, segment in zip(processed_segments, final_result["segments"])
+            )
             
             return {
                 "segments": processed_segments,
@@ -123,42 +163,53 @@ class EnhancedTranscription:
             
     def extract_speaker_insights(self, segments: List[Dict]) -> Dict[str, Any]:
         """Analyze speaker patterns and interactions."""
-        speaker_stats = {}
-        speaker_changes = 0
-        current_speaker = None
+        if not segments:
+            return {
+                "speaker_stats": {},
+                "speaker_changes": 0,
+                "conversation_score": 0.0,
+                "dominant_speaker": None
+            }
         
-        for segment in segments:
-            speaker = segment.get("speaker", "UNKNOWN")
-            
-            if speaker not in speaker_stats:
-                speaker_stats[speaker] = {
-                    "total_time": 0,
-                    "segment_count": 0,
-                    "words": 0,
-                    "energy_level": 0
-                }
-            
-            duration = segment["end"] - segment["start"]
-            speaker_stats[speaker]["total_time"] += duration
-            speaker_stats[speaker]["segment_count"] += 1
-            speaker_stats[speaker]["words"] += len(segment["text"].split())
-            
-            # Track speaker changes for conversation dynamics
-            if current_speaker and current_speaker != speaker:
-                speaker_changes += 1
-            current_speaker = speaker
+        count = len(segments)
+        starts = np.fromiter((segment["start"] for segment in segments), dtype=np.float64, count=count)
+        ends = np.fromiter((segment["end"] for segment in segments), dtype=np.float64, count=count)
+        word_counts = np.fromiter((len(segment["text"].split()) for segment in segments), dtype=np.int64, count=count)
+        speakers = np.array([segment.get("speaker", "UNKNOWN") for segment in segments])
+        
+        # Group segments by speaker; keep speakers in order of first appearance
+        labels, first_index, codes = np.unique(speakers, return_index=True, return_inverse=True)
+        order = np.argsort(first_index, kind="stable")
+        
+        total_time = np.bincount(codes, weights=ends - starts, minlength=len(labels))
+        segment_count = np.bincount(codes, minlength=len(labels))
+        words = np.bincount(codes, weights=word_counts, minlength=len(labels)).astype(np.int64)
+        
+        # Track speaker changes for conversation dynamics
+        speaker_changes = int(np.count_nonzero(speakers[1:] != speakers[:-1]))
         
         # Calculate conversation dynamics
-        total_duration = sum(stats["total_time"] for stats in speaker_stats.values())
-        for speaker, stats in speaker_stats.items():
-            stats["speaking_percentage"] = (stats["total_time"] / total_duration * 100) if total_duration > 0 else 0
-            stats["words_per_minute"] = (stats["words"] / (stats["total_time"] / 60)) if stats["total_time"] > 0 else 0
+        total_duration = total_time.sum()
+        speaking_percentage = total_time / total_duration * 100 if total_duration > 0 else np.zeros_like(total_time)
+        words_per_minute = np.divide(words * 60, total_time, out=np.zeros_like(total_time), where=total_time > 0)
+        
+        speaker_stats = {
+            str(labels[i]): {
+                "total_time": float(total_time[i]),
+                "segment_count": int(segment_count[i]),
+                "words": int(words[i]),
+                "energy_level": 0,
+                "speaking_percentage": float(speaking_percentage[i]),
+                "words_per_minute": float(words_per_minute[i])
+            }
+            for i in order
+        }
         
         return {
             "speaker_stats": speaker_stats,
             "speaker_changes": speaker_changes,
             "conversation_score": min(speaker_changes / 10, 1.0),  # Normalize to 0-1
-            "dominant_speaker": max(speaker_stats.keys(), key=lambda x: speaker_stats[x]["total_time"]) if speaker_stats else None
+            "dominant_speaker": str(labels[order[np.argmax(total_time[order])]])
         }
     
     def generate_speaker_timeline(self, segments: List[Dict]) -> List[Dict]:
@@ -175,8 +226,9 @@ class EnhancedTranscription:
         
         return timeline
 
-def transcribe_with_speaker_detection(video_id: str, job_id: str):
+def transcribe_with_speaker_detection(video_id: str, job_id: str, num_speakers: Optional[int] = None):
     """Main function for enhanced transcription with speaker detection."""
+    reporter = ProgressReporter(db, job_id)
     try:
         transcriber = EnhancedTranscription()
         
@@ -185,25 +237,20 @@ def transcribe_with_speaker_detection(video_id: str, job_id: str):
         if not video:
             raise Exception("Video not found")
         
-        # Download and extract audio
-        file_data = db.storage.download_file(video["file_path"])
-        
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.mp4') as temp_video:
-            temp_video.write(file_data)
+        # Stream the video to a temp file, on tmpfs when there is room
+        with tempfile.NamedTemporaryFile(delete=False, suffix='.mp4',
+                                         dir=get_temp_dir(video.get("file_size") or 0)) as temp_video:
             temp_video_path = temp_video.name
         
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.wav') as temp_audio:
-            temp_audio_path = temp_audio.name
-        
         try:
-            # Extract audio
-            import moviepy.editor as mp
-            video_clip = mp.VideoFileClip(temp_video_path)
-            audio_clip = video_clip.audio
-            audio_clip.write_audiofile(temp_audio_path, verbose=False, logger=None)
+            with open(temp_video_path, 'wb') as temp_video:
+                db.storage.download_file_to(video["file_path"], temp_video)
+            
+            # Extract audio straight into memory
+            audio = extract_audio_pcm(temp_video_path)
             
             # Enhanced transcription
-            result = transcriber.transcribe_with_whisperx(temp_audio_path, video_id, job_id)
+            result = transcriber.transcribe_with_whisperx(audio, video_id, job_id, num_speakers, reporter)
             
             # Analyze speaker insights
             speaker_insights = transcriber.extract_speaker_insights(result["segments"])
@@ -230,14 +277,13 @@ def transcribe_with_speaker_detection(video_id: str, job_id: str):
             transcript = db.create_transcript(transcript_data)
             
             # Update job as completed
-            db.update_job(job_id, {
+            reporter.finish({
                 "status": JobStatus.COMPLETED.value,
                 "progress": 100,
                 "metadata": {
                     "speaker_count": result["speaker_count"],
                     "enhanced_features": True
-                },
-                "updated_at": datetime.utcnow().isoformat()
+                }
             })
             
             print(f"Enhanced transcription completed for video {video_id} with {result['speaker_count']} speakers")
@@ -250,18 +296,10 @@ def transcribe_with_speaker_detection(video_id: str, job_id: str):
             # Cleanup
             if os.path.exists(temp_video_path):
                 os.remove(temp_video_path)
-            if os.path.exists(temp_audio_path):
-                os.remove(temp_audio_path)
-            
-            if 'audio_clip' in locals():
-                audio_clip.close()
-            if 'video_clip' in locals():
-                video_clip.close()
                 
     except Exception as e:
         print(f"Error in enhanced transcription for video {video_id}: {str(e)}")
-        db.update_job(job_id, {
+        reporter.finish({
             "status": JobStatus.FAILED.value,
-            "error_message": str(e),
-            "updated_at": datetime.utcnow().isoformat()
+            "error_message": str(e)
         })
@@ -1,22 +1,103 @@
 import os
 import sys
+import atexit
+import threading
 import cv2
 import numpy as np
 import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from scipy.signal import lfilter
 from datetime import datetime
-from typing import List, Dict, Tuple, Optional
+from functools import lru_cache
+from typing import List, Dict, Tuple, Optional, NamedTuple
 import mediapipe as mp
 
 # Add shared directory to path
 sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'shared'))
 
 from database import Database
-from utils import generate_id
+from utils import generate_id, get_temp_dir
 from schemas import JobStatus
+from progress import ProgressReporter
 
 db = Database()
 
+# Frames are downscaled to at most this width before detection. MediaPipe's
+# detectors run on much smaller inputs internally (128-256px), and results are
+# relative coordinates, so this only trims conversion and copy work.
+DETECTION_MAX_WIDTH = 640
+
+# Ask OpenCV's FFmpeg backend for hardware decoding (NVDEC/VAAPI/...) when the
+# build supports it; set VIDEO_HW_DECODE=0 to force software decoding
+HW_DECODE_ENABLED = os.environ.get("VIDEO_HW_DECODE", "1") != "0"
+
+# Motion gate: sampled frames whose 64x64 grayscale thumbnail differs from the
+# last detected frame by less than this mean absolute difference (0-255)
+# reuse that frame's detections. MAX_REUSED_SAMPLES bounds how long results
+# can be carried forward before detection is forced again.
+MOTION_THUMBNAIL_SIZE = (64, 64)
+MOTION_DIFF_THRESHOLD = 4.0
+MAX_REUSED_SAMPLES = 3
+
+# Faces tracked by the landmark mesh. Cropping only follows the primary face,
+# so one is enough unless multi-face landmarks are needed.
+FACE_MESH_MAX_FACES = int(os.environ.get("FACE_MESH_MAX_FACES", "1"))
+
+# MediaPipe pose landmark indices for the shoulders and hips
+TORSO_KEYPOINTS = [11, 12, 23, 24]
+
+def open_video_capture(video_path: str) -> cv2.VideoCapture:
+    """Open a video for reading, preferring hardware-accelerated decoding."""
+    if HW_DECODE_ENABLED and hasattr(cv2, "CAP_PROP_HW_ACCELERATION"):
+        cap = cv2.VideoCapture(video_path, cv2.CAP_FFMPEG, [
+            cv2.CAP_PROP_HW_ACCELERATION, cv2.VIDEO_ACCELERATION_ANY
+        ])
+        if cap.isOpened():
+            return cap
+        cap.release()
+    
+    # Software decoding fallback
+    return cv2.VideoCapture(video_path)
+
+class _CropParams(NamedTuple):
+    """Crop window geometry for one frame size and target ratio."""
+    frame_width: int
+    frame_height: int
+    crop_width: int
+    crop_height: int
+    max_x: int
+    max_y: int
+
+@lru_cache(maxsize=64)
+def _crop_params(width: int, height: int, target_ratio: str) -> _CropParams:
+    """Resolve the crop size for a target ratio once, rather than per frame."""
+    if target_ratio == "9:16":
+        # Vertical crop, full height
+        crop_width = min(width, height * 9 // 16)
+        crop_height = height
+    elif target_ratio == "1:1":
+        # Square crop
+        crop_width = crop_height = min(width, height)
+    else:  # "16:9"
+        # Horizontal crop, full width
+        crop_width = width
+        crop_height = min(height, width * 9 // 16)
+    
+    return _CropParams(width, height, crop_width, crop_height, width - crop_width, height - crop_height)
+
 class FaceTracker:
+    _instance: Optional["FaceTracker"] = None
+    _instance_lock = threading.Lock()
+    
+    @classmethod
+    def instance(cls) -> "FaceTracker":
+        """Return the process-wide tracker, loading the MediaPipe graphs on first use."""
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = cls()
+                atexit.register(cls._instance.close)
+            return cls._instance
+    
     def __init__(self):
         self.mp_face_detection = mp.solutions.face_detection
         self.mp_face_mesh = mp.solutions.face_mesh
@@ -29,168 +110,272 @@ class FaceTracker:
         )
         self.face_mesh = self.mp_face_mesh.FaceMesh(
             static_image_mode=False,
-            max_num_faces=5,
-            refine_landmarks=True,
+            max_num_faces=FACE_MESH_MAX_FACES,
+            # Iris refinement is not used for cropping
+            refine_landmarks=False,
             min_detection_confidence=0.5,
             min_tracking_confidence=0.5
         )
         self.pose = self.mp_pose.Pose(
             static_image_mode=False,
-            model_complexity=1,
+            # Lite model: enough to locate the torso center
+            model_complexity=0,
             smooth_landmarks=True,
             min_detection_confidence=0.5,
             min_tracking_confidence=0.5
         )
+        
+        # MediaPipe graphs are not thread-safe and carry tracking state
+        # between frames, so only one video may run through them at a time;
+        # that state is reset at the start of each video
+        self._lock = threading.Lock()
+        self._pose_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="pose")
+    
+    def close(self):
+        """Release the MediaPipe graphs."""
+        self._pose_executor.shutdown(wait=True)
+        self.face_detection.close()
+        self.face_mesh.close()
+        self.pose.close()
+    
+    def _to_detection_rgb(self, frame: np.ndarray,
+                          buffers: Optional[Dict[str, np.ndarray]] = None) -> np.ndarray:
+        """Convert a BGR frame to RGB, downscaled for the detectors.
+        
+        When ``buffers`` is given, the scaled and RGB images are written into
+        arrays kept there, so frames of the same video reuse one allocation.
+        """
+        if buffers is None:
+            buffers = {}
+        height, width = frame.shape[:2]
+        if width > DETECTION_MAX_WIDTH:
+            scaled_height = max(1, round(height * DETECTION_MAX_WIDTH / width))
+            frame = buffers["scaled"] = cv2.resize(
+                frame, (DETECTION_MAX_WIDTH, scaled_height),
+                dst=buffers.get("scaled"), interpolation=cv2.INTER_AREA
+            )
+        buffers["rgb"] = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB, dst=buffers.get("rgb"))
+        return buffers["rgb"]
     
     def detect_faces_in_video(self, video_path: str) -> List[Dict]:
         """Detect and track faces throughout the video."""
-        cap = cv2.VideoCapture(video_path)
+        face_tracking_data, _, _ = self._track_video(video_path, detect_faces=True, detect_pose=False)
+        return face_tracking_data
+    
+    def detect_pose_in_video(self, video_path: str) -> List[Dict]:
+        """Detect and track human poses throughout the video."""
+        _, pose_tracking_data, _ = self._track_video(video_path, detect_faces=False, detect_pose=True)
+        return pose_tracking_data
+    
+    def detect_faces_and_pose(self, video_path: str) -> Tuple[List[Dict], List[Dict], Tuple[int, int]]:
+        """Detect faces and poses in a single decode pass.
+        
+        Returns (face_data, pose_data, (width, height)).
+        """
+        return self._track_video(video_path, detect_faces=True, detect_pose=True)
+    
+    def _track_video(self, video_path: str, detect_faces: bool,
+                     detect_pose: bool) -> Tuple[List[Dict], List[Dict], Tuple[int, int]]:
+        """Decode the video once and run the requested detectors on each sampled frame."""
+        with self._lock:
+            return self._track_video_locked(video_path, detect_faces, detect_pose)
+    
+    def _track_video_locked(self, video_path: str, detect_faces: bool,
+                            detect_pose: bool) -> Tuple[List[Dict], List[Dict], Tuple[int, int]]:
+        # Drop landmark tracking and smoothing left over from the previous video
+        self.face_mesh.reset()
+        self.pose.reset()
+        
+        cap = open_video_capture(video_path)
         fps = cap.get(cv2.CAP_PROP_FPS)
-        frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+        height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
         
         face_tracking_data = []
+        pose_tracking_data = []
         frame_index = 0
         
         # Process every 10th frame for efficiency
         sample_rate = 10
         
+        # Thumbnail of the last frame the detectors actually ran on
+        keyframe_thumb = None
+        reused_samples = 0
+        
+        # Detector input buffers, reused for every sampled frame of this video
+        detection_buffers: Dict[str, np.ndarray] = {}
+        
         while cap.isOpened():
-            ret, frame = cap.read()
-            if not ret:
+            # grab() advances the decoder without converting the frame; only
+            # sampled frames pay for retrieve()
+            if not cap.grab():
                 break
             
             if frame_index % sample_rate == 0:
-                timestamp = frame_index / fps
+                ret, frame = cap.retrieve()
+                if not ret:
+                    break
                 
-                # Convert BGR to RGB
-                rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-                
-                # Detect faces
-                face_results = self.face_detection.process(rgb_frame)
-                
-                frame_data = {
-                    "timestamp": timestamp,
-                    "frame_index": frame_index,
-                    "faces": [],
-                    "frame_center": (frame.shape[1] // 2, frame.shape[0] // 2)
-                }
+                timestamp = frame_index / fps
                 
-                if face_results.detections:
-                    for detection in face_results.detections:
-                        # Get bounding box
-                        bbox = detection.location_data.relative_bounding_box
-                        h, w, _ = frame.shape
-                        
-                        face_data = {
-                            "bbox": {
-                                "x": int(bbox.xmin * w),
-                                "y": int(bbox.ymin * h),
-                                "width": int(bbox.width * w),
-                                "height": int(bbox.height * h)
-                            },
-                            "confidence": detection.score[0],
-                            "center": (
-                                int((bbox.xmin + bbox.width / 2) * w),
-                                int((bbox.ymin + bbox.height / 2) * h)
-                            )
-                        }
-                        
-                        # Add face landmarks for more detailed tracking
-                        mesh_results = self.face_mesh.process(rgb_frame)
-                        if mesh_results.multi_face_landmarks:
-                            landmarks = mesh_results.multi_face_landmarks[0]
-                            face_data["landmarks"] = [
-                                {"x": landmark.x * w, "y": landmark.y * h, "z": landmark.z}
-                                for landmark in landmarks.landmark
-                            ]
-                        
-                        frame_data["faces"].append(face_data)
+                thumb = cv2.cvtColor(
+                    cv2.resize(frame, MOTION_THUMBNAIL_SIZE, interpolation=cv2.INTER_AREA),
+                    cv2.COLOR_BGR2GRAY
+                )
                 
-                face_tracking_data.append(frame_data)
+                if (keyframe_thumb is not None and reused_samples < MAX_REUSED_SAMPLES
+                        and cv2.absdiff(thumb, keyframe_thumb).mean() < MOTION_DIFF_THRESHOLD):
+                    # Near-static scene: carry the last detections forward
+                    reused_samples += 1
+                    if detect_faces:
+                        face_tracking_data.append(
+                            {**face_tracking_data[-1], "timestamp": timestamp, "frame_index": frame_index}
+                        )
+                    if detect_pose:
+                        pose_tracking_data.append(
+                            {**pose_tracking_data[-1], "timestamp": timestamp, "frame_index": frame_index}
+                        )
+                else:
+                    keyframe_thumb = thumb
+                    reused_samples = 0
+                    
+                    # Convert BGR to RGB at detection resolution, once for both detectors
+                    rgb_frame = self._to_detection_rgb(frame, detection_buffers)
+                    
+                    # Pose runs on its own thread while the face graphs run here;
+                    # MediaPipe releases the GIL while a graph is processing
+                    if detect_pose:
+                        pose_future = self._pose_executor.submit(
+                            self._detect_pose_in_frame, frame, rgb_frame, frame_index, timestamp
+                        )
+                    if detect_faces:
+                        face_tracking_data.append(
+                            self._detect_faces_in_frame(frame, rgb_frame, frame_index, timestamp)
+                        )
+                    if detect_pose:
+                        pose_tracking_data.append(pose_future.result())
             
             frame_index += 1
         
         cap.release()
-        return face_tracking_data
+        return face_tracking_data, pose_tracking_data, (width, height)
     
-    def detect_pose_in_video(self, video_path: str) -> List[Dict]:
-        """Detect and track human poses throughout the video."""
-        cap = cv2.VideoCapture(video_path)
-        fps = cap.get(cv2.CAP_PROP_FPS)
+    def _detect_faces_in_frame(self, frame: np.ndarray, rgb_frame: np.ndarray,
+                               frame_index: int, timestamp: float) -> Dict:
+        """Run face detection and landmarks on one sampled frame."""
+        # Detect faces
+        face_results = self.face_detection.process(rgb_frame)
         
-        pose_tracking_data = []
-        frame_index = 0
-        sample_rate = 10
+        frame_data = {
+            "timestamp": timestamp,
+            "frame_index": frame_index,
+            "faces": [],
+            "frame_center": (frame.shape[1] // 2, frame.shape[0] // 2)
+        }
         
-        while cap.isOpened():
-            ret, frame = cap.read()
-            if not ret:
-                break
+        if face_results.detections:
+            h, w, _ = frame.shape
             
-            if frame_index % sample_rate == 0:
-                timestamp = frame_index / fps
-                rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-                
-                # Process pose
-                pose_results = self.pose.process(rgb_frame)
+            # Face mesh returns every face in the frame at once, so run it a
+            # single time and pair each mesh with its nearest detection
+            mesh_results = self.face_mesh.process(rgb_frame)
+            mesh_faces = []
+            mesh_centroids = None
+            if mesh_results.multi_face_landmarks:
+                # One (468, 3) float32 array of pixel x, y and relative z per face
+                scale = np.array([w, h, 1], dtype=np.float32)
+                mesh_faces = [
+                    np.array([(landmark.x, landmark.y, landmark.z) for landmark in face.landmark],
+                             dtype=np.float32) * scale
+                    for face in mesh_results.multi_face_landmarks
+                ]
+                mesh_centroids = np.array([face[:, :2].mean(axis=0) for face in mesh_faces])
+            
+            for detection in face_results.detections:
+                # Get bounding box
+                bbox = detection.location_data.relative_bounding_box
                 
-                frame_data = {
-                    "timestamp": timestamp,
-                    "frame_index": frame_index,
-                    "pose_detected": False,
-                    "keypoints": []
+                face_data = {
+                    "bbox": {
+                        "x": int(bbox.xmin * w),
+                        "y": int(bbox.ymin * h),
+                        "width": int(bbox.width * w),
+                        "height": int(bbox.height * h)
+                    },
+                    "confidence": detection.score[0],
+                    "center": (
+                        int((bbox.xmin + bbox.width / 2) * w),
+                        int((bbox.ymin + bbox.height / 2) * h)
+                    )
                 }
                 
-                if pose_results.pose_landmarks:
-                    frame_data["pose_detected"] = True
-                    h, w, _ = frame.shape
-                    
-                    for idx, landmark in enumerate(pose_results.pose_landmarks.landmark):
-                        frame_data["keypoints"].append({
-                            "id": idx,
-                            "x": landmark.x * w,
-                            "y": landmark.y * h,
-                            "z": landmark.z,
-                            "visibility": landmark.visibility
-                        })
-                
-                pose_tracking_data.append(frame_data)
+                frame_data["faces"].append(face_data)
             
-            frame_index += 1
+            # Add face landmarks for more detailed tracking. The mesh may track
+            # fewer faces than were detected, so each mesh goes to its closest
+            # detection rather than every detection taking the nearest mesh.
+            if mesh_centroids is not None:
+                centers = np.array([face["center"] for face in frame_data["faces"]], dtype=np.float32)
+                distances = np.sum((centers[:, None, :] - mesh_centroids[None, :, :]) ** 2, axis=2)
+                for mesh_index, face_index in enumerate(np.argmin(distances, axis=0)):
+                    frame_data["faces"][face_index]["landmarks"] = mesh_faces[mesh_index]
         
-        cap.release()
-        return pose_tracking_data
+        return frame_data
+    
+    def _detect_pose_in_frame(self, frame: np.ndarray, rgb_frame: np.ndarray,
+                              frame_index: int, timestamp: float) -> Dict:
+        """Run pose estimation on one sampled frame."""
+        # Process pose
+        pose_results = self.pose.process(rgb_frame)
+        
+        frame_data = {
+            "timestamp": timestamp,
+            "frame_index": frame_index,
+            "pose_detected": False,
+            "keypoints": np.empty((0, 4), dtype=np.float32)
+        }
+        
+        if pose_results.pose_landmarks:
+            frame_data["pose_detected"] = True
+            h, w, _ = frame.shape
+            
+            # (33, 4) float32 array of pixel x, y, relative z and visibility,
+            # indexed by MediaPipe pose landmark id
+            frame_data["keypoints"] = np.array(
+                [(landmark.x, landmark.y, landmark.z, landmark.visibility)
+                 for landmark in pose_results.pose_landmarks.landmark],
+                dtype=np.float32
+            ) * np.array([w, h, 1, 1], dtype=np.float32)
+        
+        return frame_data
     
     def calculate_smart_crop_regions(self, face_data: List[Dict], pose_data: List[Dict], 
                                    video_dimensions: Tuple[int, int], target_ratio: str) -> List[Dict]:
         """Calculate optimal crop regions based on face and pose tracking."""
         width, height = video_dimensions
+        params = _crop_params(width, height, target_ratio)
         crop_regions = []
         
         for i, face_frame in enumerate(face_data):
             timestamp = face_frame["timestamp"]
             
-            # Default to center crop
-            crop_region = self._get_center_crop(width, height, target_ratio)
-            crop_region["timestamp"] = timestamp
-            crop_region["tracking_method"] = "center"
-            
             # If faces detected, prioritize face-based cropping
             if face_frame["faces"]:
-                crop_region = self._get_face_based_crop(
-                    face_frame["faces"], width, height, target_ratio
-                )
-                crop_region["timestamp"] = timestamp
-                crop_region["tracking_method"] = "face"
+                crop_region = self._get_face_based_crop(face_frame["faces"], params)
+                tracking_method = "face"
             
             # If pose detected but no face, use pose-based cropping
             elif i < len(pose_data) and pose_data[i]["pose_detected"]:
-                crop_region = self._get_pose_based_crop(
-                    pose_data[i]["keypoints"], width, height, target_ratio
-                )
-                crop_region["timestamp"] = timestamp
-                crop_region["tracking_method"] = "pose"
+                crop_region = self._get_pose_based_crop(pose_data[i]["keypoints"], params)
+                tracking_method = "pose"
+            
+            # Default to center crop
+            else:
+                crop_region = self._get_center_crop(params)
+                tracking_method = "center"
             
+            crop_region["timestamp"] = timestamp
+            crop_region["tracking_method"] = tracking_method
             crop_regions.append(crop_region)
         
         # Smooth crop regions to avoid jittery movement
@@ -198,110 +383,55 @@ class FaceTracker:
         
         return smoothed_regions
     
-    def _get_face_based_crop(self, faces: List[Dict], width: int, height: int, target_ratio: str) -> Dict:
+    def _get_face_based_crop(self, faces: List[Dict], params: _CropParams) -> Dict:
         """Calculate crop region based on detected faces."""
         if not faces:
-            return self._get_center_crop(width, height, target_ratio)
+            return self._get_center_crop(params)
         
         # For multiple faces, focus on the largest/most confident face
         primary_face = max(faces, key=lambda f: f["confidence"] * f["bbox"]["width"] * f["bbox"]["height"])
-        face_center = primary_face["center"]
         
-        if target_ratio == "9:16":
-            # Vertical crop
-            crop_width = min(width, height * 9 // 16)
-            crop_height = height
-            
-            # Center crop horizontally around face
-            crop_x = max(0, min(face_center[0] - crop_width // 2, width - crop_width))
-            crop_y = 0
-            
-        elif target_ratio == "1:1":
-            # Square crop
-            crop_size = min(width, height)
-            
-            # Center around face
-            crop_x = max(0, min(face_center[0] - crop_size // 2, width - crop_size))
-            crop_y = max(0, min(face_center[1] - crop_size // 2, height - crop_size))
-            crop_width = crop_height = crop_size
-            
-        else:  # "16:9"
-            # Horizontal crop
-            crop_width = width
-            crop_height = min(height, width * 9 // 16)
-            
-            # Center crop vertically around face
-            crop_x = 0
-            crop_y = max(0, min(face_center[1] - crop_height // 2, height - crop_height))
-        
-        return {
-            "x": crop_x,
-            "y": crop_y,
-            "width": crop_width,
-            "height": crop_height,
-            "confidence": primary_face["confidence"]
-        }
+        return self._calculate_crop_around_center(
+            primary_face["center"], params, primary_face["confidence"]
+        )
     
-    def _get_pose_based_crop(self, keypoints: List[Dict], width: int, height: int, target_ratio: str) -> Dict:
+    def _get_pose_based_crop(self, keypoints: np.ndarray, params: _CropParams) -> Dict:
         """Calculate crop region based on pose keypoints."""
-        if not keypoints:
-            return self._get_center_crop(width, height, target_ratio)
-        
-        # Find torso center (average of shoulder and hip keypoints)
-        relevant_points = []
+        if len(keypoints) <= max(TORSO_KEYPOINTS):
+            return self._get_center_crop(params)
         
-        # MediaPipe pose landmark indices
-        torso_indices = [11, 12, 23, 24]  # shoulders and hips
+        # Find torso center (average of visible shoulder and hip keypoints)
+        torso = keypoints[TORSO_KEYPOINTS]
+        relevant_points = torso[torso[:, 3] > 0.5, :2]
         
-        for point in keypoints:
-            if point["id"] in torso_indices and point["visibility"] > 0.5:
-                relevant_points.append((point["x"], point["y"]))
-        
-        if not relevant_points:
-            return self._get_center_crop(width, height, target_ratio)
+        if len(relevant_points) == 0:
+            return self._get_center_crop(params)
         
         # Calculate center of torso
-        center_x = sum(p[0] for p in relevant_points) / len(relevant_points)
-        center_y = sum(p[1] for p in relevant_points) / len(relevant_points)
+        center_x, center_y = relevant_points.mean(axis=0)
         
-        return self._calculate_crop_around_center(
-            (center_x, center_y), width, height, target_ratio
-        )
+        return self._calculate_crop_around_center((center_x, center_y), params)
     
-    def _get_center_crop(self, width: int, height: int, target_ratio: str) -> Dict:
+    def _get_center_crop(self, params: _CropParams) -> Dict:
         """Calculate center crop region."""
-        center = (width // 2, height // 2)
-        return self._calculate_crop_around_center(center, width, height, target_ratio)
+        center = (params.frame_width // 2, params.frame_height // 2)
+        return self._calculate_crop_around_center(center, params)
     
-    def _calculate_crop_around_center(self, center: Tuple[float, float], 
-                                    width: int, height: int, target_ratio: str) -> Dict:
-        """Calculate crop region around a center point."""
-        center_x, center_y = center
+    def _calculate_crop_around_center(self, center: Tuple[float, float], params: _CropParams,
+                                      confidence: float = 0.5) -> Dict:
+        """Calculate crop region around a center point.
         
-        if target_ratio == "9:16":
-            crop_width = min(width, height * 9 // 16)
-            crop_height = height
-            crop_x = max(0, min(int(center_x - crop_width // 2), width - crop_width))
-            crop_y = 0
-            
-        elif target_ratio == "1:1":
-            crop_size = min(width, height)
-            crop_x = max(0, min(int(center_x - crop_size // 2), width - crop_size))
-            crop_y = max(0, min(int(center_y - crop_size // 2), height - crop_size))
-            crop_width = crop_height = crop_size
-            
-        else:  # "16:9"
-            crop_width = width
-            crop_height = min(height, width * 9 // 16)
-            crop_x = 0
-            crop_y = max(0, min(int(center_y - crop_height // 2), height - crop_height))
+        A full-width or full-height crop has no slack on that axis, so the
+        clamp pins it to 0 without special-casing the ratio.
+        """
+        center_x, center_y = center
         
         return {
-            "x": crop_x,
-            "y": crop_y,
-            "width": crop_width,
-            "height": crop_height,
-            "confidence": 0.5
+            "x": max(0, min(int(center_x - params.crop_width // 2), params.max_x)),
+            "y": max(0, min(int(center_y - params.crop_height // 2), params.max_y)),
+            "width": params.crop_width,
+            "height": params.crop_height,
+            "confidence": confidence
         }
     
     def _smooth_crop_regions(self, regions: List[Dict], smoothing_factor: float = 0.3) -> List[Dict]:
@@ -309,82 +439,55 @@ class FaceTracker:
         if len(regions) <= 1:
             return regions
         
-        smoothed = [regions[0]]
+        xs = np.fromiter((region["x"] for region in regions), dtype=np.float64, count=len(regions))
+        ys = np.fromiter((region["y"] for region in regions), dtype=np.float64, count=len(regions))
         
-        for i in range(1, len(regions)):
-            current = regions[i]
-            previous = smoothed[-1]
-            
-            # Exponential moving average
-            smooth_x = int(previous["x"] * (1 - smoothing_factor) + current["x"] * smoothing_factor)
-            smooth_y = int(previous["y"] * (1 - smoothing_factor) + current["y"] * smoothing_factor)
-            
-            smoothed_region = {
-                **current,
-                "x": smooth_x,
-                "y": smooth_y
-            }
-            
-            smoothed.append(smoothed_region)
+        # Exponential moving average as a first-order IIR filter, seeded so
+        # the first region passes through unchanged
+        b, a = [smoothing_factor], [1.0, -(1 - smoothing_factor)]
+        smooth_x, _ = lfilter(b, a, xs, zi=[(1 - smoothing_factor) * xs[0]])
+        smooth_y, _ = lfilter(b, a, ys, zi=[(1 - smoothing_factor) * ys[0]])
+        smooth_x = np.rint(smooth_x).astype(np.int64)
+        smooth_y = np.rint(smooth_y).astype(np.int64)
         
-        return smoothed
+        return [
+            {**region, "x": int(x), "y": int(y)}
+            for region, x, y in zip(regions, smooth_x, smooth_y)
+        ]
 
 def analyze_video_subjects(video_id: str, job_id: str) -> Dict:
     """Analyze video for face and pose tracking data."""
+    reporter = ProgressReporter(db, job_id)
     try:
         print(f"Starting subject analysis for video {video_id}")
         
-        tracker = FaceTracker()
+        tracker = FaceTracker.instance()
         
         # Update job status
-        db.update_job(job_id, {
-            "status": JobStatus.PROCESSING.value,
-            "progress": 10,
-            "updated_at": datetime.utcnow().isoformat()
-        })
+        reporter.set(10, status=JobStatus.PROCESSING.value)
         
         # Get video record
         video = db.get_video(video_id)
         if not video:
             raise Exception("Video not found")
         
-        # Download video
-        file_data = db.storage.download_file(video["file_path"])
-        
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.mp4') as temp_file:
-            temp_file.write(file_data)
+        # Stream the video to a temp file, on tmpfs when there is room
+        with tempfile.NamedTemporaryFile(delete=False, suffix='.mp4',
+                                         dir=get_temp_dir(video.get("file_size") or 0)) as temp_file:
             temp_path = temp_file.name
         
         try:
-            # Get video dimensions
-            cap = cv2.VideoCapture(temp_path)
-            width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-            height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-            cap.release()
+            with open(temp_path, 'wb') as temp_file:
+                db.storage.download_file_to(video["file_path"], temp_file)
             
             # Update progress
-            db.update_job(job_id, {
-                "progress": 30,
-                "updated_at": datetime.utcnow().isoformat()
-            })
+            reporter.set(30)
             
-            # Detect faces
-            face_data = tracker.detect_faces_in_video(temp_path)
+            # Detect faces and poses in one pass over the video
+            face_data, pose_data, (width, height) = tracker.detect_faces_and_pose(temp_path)
             
             # Update progress
-            db.update_job(job_id, {
-                "progress": 60,
-                "updated_at": datetime.utcnow().isoformat()
-            })
-            
-            # Detect poses
-            pose_data = tracker.detect_pose_in_video(temp_path)
-            
-            # Update progress
-            db.update_job(job_id, {
-                "progress": 80,
-                "updated_at": datetime.utcnow().isoformat()
-            })
+            reporter.set(80)
             
             # Calculate smart crop regions for each aspect ratio
             crop_regions = {
@@ -414,14 +517,13 @@ def analyze_video_subjects(video_id: str, job_id: str) -> Dict:
             })
             
             # Update job as completed
-            db.update_job(job_id, {
+            reporter.finish({
                 "status": JobStatus.COMPLETED.value,
                 "progress": 100,
                 "metadata": {
                     "face_detection_rate": face_detection_rate,
                     "tracking_quality": analysis_result["tracking_quality"]
-                },
-                "updated_at": datetime.utcnow().isoformat()
+                }
             })
             
             print(f"Subject analysis completed for video {video_id}")
@@ -433,9 +535,8 @@ def analyze_video_subjects(video_id: str, job_id: str) -> Dict:
                 
     except Exception as e:
         print(f"Error analyzing video subjects for {video_id}: {str(e)}")
-        db.update_job(job_id, {
+        reporter.finish({
             "status": JobStatus.FAILED.value,
-            "error_message": str(e),
-            "updated_at": datetime.utcnow().isoformat()
+            "error_message": str(e)
         })
         raise
@@ -2,43 +2,68 @@ import os
 import sys
 import tempfile
 import re
+import hashlib
+import subprocess
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
 from datetime import datetime
-from typing import List, Dict, Tuple
+from typing import List, Dict, Tuple, Callable, Any, Optional
 import scenedetect
 from scenedetect.video_manager import VideoManager
 from scenedetect.scene_manager import SceneManager
 from scenedetect.detectors import ContentDetector
 from keybert import KeyBERT
-from transformers import pipeline, AutoTokenizer, AutoModelForSequenceClassification
 import numpy as np
+import torch
 
 # Add shared directory to path
 sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'shared'))
 
 from database import Database
-from utils import generate_id
+from utils import generate_id, get_temp_dir, cpu_threads_per_worker
 from schemas import JobStatus
+from progress import ProgressReporter
+from media import FFMPEG_BINARY
+from nlp import load_text_classifier
 
 
 db = Database()
 
+# Run the transformer pipelines on the first GPU in fp16 when one is available
+PIPELINE_DEVICE = 0 if torch.cuda.is_available() else -1
+PIPELINE_DTYPE = torch.float16 if torch.cuda.is_available() else None
+
+# Use this process's share of the cores for intra-op parallelism on CPU; a
+# couple of inter-op threads suffice
+TORCH_NUM_THREADS = int(os.environ.get("TORCH_NUM_THREADS", cpu_threads_per_worker()))
+torch.set_num_threads(TORCH_NUM_THREADS)
+try:
+    torch.set_num_interop_threads(2)
+except RuntimeError:
+    # Already fixed once inter-op work has run in this process
+    pass
+
+# Directories holding int8-quantized ONNX exports, created with
+# `optimum-cli export onnx` followed by `optimum-cli onnxruntime quantize`;
+# used in place of the PyTorch models when running on CPU
+SENTIMENT_ONNX_DIR = os.environ.get("SENTIMENT_ONNX_DIR")
+
 # Initialize models for highlight detection
 keybert_model = KeyBERT()
 
 # Initialize sentiment analysis pipeline
-sentiment_analyzer = pipeline(
+sentiment_analyzer = load_text_classifier(
     "sentiment-analysis", 
-    model="cardiffnlp/twitter-roberta-base-sentiment-latest",
+    "cardiffnlp/twitter-roberta-base-sentiment-latest",
+    SENTIMENT_ONNX_DIR,
+    device=PIPELINE_DEVICE,
+    torch_dtype=PIPELINE_DTYPE,
     return_all_scores=True
 )
 
-# Initialize summarization pipeline
-summarizer = pipeline(
-    "summarization", 
-    model="facebook/bart-large-cnn",
-    max_length=50,
-    min_length=10
-)
+# Segments scored per sentiment forward pass
+SENTIMENT_BATCH_SIZE = 32
 
 # Viral keywords and phrases that tend to perform well
 VIRAL_KEYWORDS = [
@@ -52,19 +77,97 @@ VIRAL_KEYWORDS = [
     "always", "everyone", "nobody", "first", "last", "best", "worst", "top",
     "bottom", "new", "old", "young", "genius", "stupid", "smart", "dumb"
 ]
+VIRAL_KEYWORD_SET = frozenset(VIRAL_KEYWORDS)
+
+
+def _keyword_pattern(keywords: List[str]) -> re.Pattern:
+    """Compile keywords into one case-insensitive whole-word alternation."""
+    alternation = "|".join(re.escape(k) for k in sorted(keywords, key=len, reverse=True))
+    return re.compile(r"\b(?:" + alternation + r")\b", re.IGNORECASE)
+
+
+VIRAL_RE = _keyword_pattern(VIRAL_KEYWORDS)
+# Strongest keywords, used for title phrases and energy checks
+TITLE_KEYWORD_RE = _keyword_pattern(VIRAL_KEYWORDS[:20])
+ENERGY_KEYWORD_RE = _keyword_pattern(VIRAL_KEYWORDS[:30])
+
+# Filler words stripped from titles, and whitespace runs they leave behind
+FILLER_RE = re.compile(r'\b(um|uh|like|you know|so|well)\b', re.IGNORECASE)
+WHITESPACE_RE = re.compile(r'\s+')
+
+# ffmpeg scene score (0-1) above which a frame starts a new scene
+SCENE_CHANGE_THRESHOLD = float(os.environ.get("SCENE_CHANGE_THRESHOLD", "0.3"))
+SHOWINFO_PTS_RE = re.compile(r"\bpts_time:\s*(-?[0-9.]+)")
+
+# Per-text model outputs kept per worker process; stock phrases and
+# re-processed videos reuse them instead of re-running the models
+NLP_CACHE_SIZE = int(os.environ.get("NLP_CACHE_SIZE", "10000"))
+
+
+class TextResultCache:
+    """Bounded LRU of model outputs keyed by the SHA-1 of the input text."""
+    
+    def __init__(self, maxsize: int = NLP_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._items: "OrderedDict[bytes, Any]" = OrderedDict()
+    
+    @staticmethod
+    def _key(text: str) -> bytes:
+        return hashlib.sha1(text.encode("utf-8")).digest()
+    
+    def map(self, texts: List[str], compute: Callable[[List[str]], List[Any]]) -> List[Any]:
+        """Return compute's result for each text, running it once on the texts not cached yet.
+        
+        A None result marks a failed computation; it is returned but not
+        cached, so the text is retried on the next call.
+        """
+        keys = [self._key(text) for text in texts]
+        results = {}
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key in self._items:
+                self._items.move_to_end(key)
+                results[key] = self._items[key]
+            else:
+                missing.setdefault(key, text)
+        
+        if missing:
+            for key, result in zip(missing, compute(list(missing.values()))):
+                results[key] = result
+                if result is not None:
+                    self._items[key] = result
+            while len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+        
+        return [results[key] for key in keys]
+
+
+sentiment_cache = TextResultCache()
+keyword_cache = TextResultCache()
+
+
+@dataclass(slots=True)
+class SegmentScore:
+    start_time: float
+    end_time: float
+    text: str
+    score: float
+    keywords: List[str]
+    title: str
+    keyword_score: float
+    sentiment_score: float
+    length_score: float
 
 
 def detect_highlights(video_id: str, max_highlights: int, job_id: str):
     """Detect highlights using NLP and scene detection."""
+    # Progress is written in the background; only the final status blocks
+    reporter = ProgressReporter(db, job_id)
     try:
         print(f"Starting highlight detection for video {video_id}")
         
         # Update job status
-        db.update_job(job_id, {
-            "status": JobStatus.PROCESSING.value,
-            "progress": 10,
-            "updated_at": datetime.utcnow().isoformat()
-        })
+        reporter.set(10, status=JobStatus.PROCESSING.value)
         
         # Get video and transcript
         video = db.get_video(video_id)
@@ -73,45 +176,41 @@ def detect_highlights(video_id: str, max_highlights: int, job_id: str):
         if not video or not transcript:
             raise Exception("Video or transcript not found")
         
-        # Download video for scene detection
-        file_data = db.storage.download_file(video["file_path"])
-        
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.mp4') as temp_file:
-            temp_file.write(file_data)
+        # Stream the video for scene detection to a temp file, on tmpfs when there is room
+        with tempfile.NamedTemporaryFile(delete=False, suffix='.mp4',
+                                         dir=get_temp_dir(video.get("file_size") or 0)) as temp_file:
             temp_path = temp_file.name
         
         try:
-            # Step 1: Scene detection
-            scene_changes = detect_scene_changes(temp_path)
+            with open(temp_path, 'wb') as temp_file:
+                db.storage.download_file_to(video["file_path"], temp_file)
             
-            # Update progress
-            db.update_job(job_id, {
-                "progress": 30,
-                "updated_at": datetime.utcnow().isoformat()
-            })
-            
-            # Step 2: Analyze transcript segments
-            segments = transcript["segments"]
-            segment_scores = analyze_transcript_segments(segments)
+            # Steps 1 and 2 are independent: detect scenes on a worker thread
+            # (decoding releases the GIL) while the transcript is analyzed here
+            with ThreadPoolExecutor(max_workers=1) as executor:
+                scene_future = executor.submit(detect_scene_changes, temp_path)
+                
+                segments = transcript["segments"]
+                segment_scores = analyze_transcript_segments(segments)
+                
+                # Update progress
+                reporter.set(30)
+                
+                scene_changes = scene_future.result()
             
             # Update progress
-            db.update_job(job_id, {
-                "progress": 60,
-                "updated_at": datetime.utcnow().isoformat()
-            })
+            reporter.set(60)
             
             # Step 3: Combine scene detection with transcript analysis
             highlights = combine_analysis(segments, segment_scores, scene_changes, max_highlights)
             
             # Update progress
-            db.update_job(job_id, {
-                "progress": 80,
-                "updated_at": datetime.utcnow().isoformat()
-            })
+            reporter.set(80)
             
-            # Step 4: Save highlights to database
-            for highlight in highlights:
-                highlight_data = {
+            # Step 4: Save all highlights to database in one insert
+            created_at = datetime.utcnow().isoformat()
+            db.create_highlights([
+                {
                     "id": generate_id(),
                     "video_id": video_id,
                     "start_time": highlight["start_time"],
@@ -120,16 +219,16 @@ def detect_highlights(video_id: str, max_highlights: int, job_id: str):
                     "keywords": highlight["keywords"],
                     "title": highlight["title"],
                     "description": highlight.get("description"),
-                    "created_at": datetime.utcnow().isoformat()
+                    "created_at": created_at
                 }
-                db.create_highlight(highlight_data)
+                for highlight in highlights
+            ])
             
             # Update job as completed
-            db.update_job(job_id, {
+            reporter.finish({
                 "status": JobStatus.COMPLETED.value,
                 "progress": 100,
-                "metadata": {"highlights_found": len(highlights)},
-                "updated_at": datetime.utcnow().isoformat()
+                "metadata": {"highlights_found": len(highlights)}
             })
             
             print(f"Highlight detection completed for video {video_id}. Found {len(highlights)} highlights.")
@@ -141,14 +240,36 @@ def detect_highlights(video_id: str, max_highlights: int, job_id: str):
                 
     except Exception as e:
         print(f"Error detecting highlights for video {video_id}: {str(e)}")
-        db.update_job(job_id, {
+        reporter.finish({
             "status": JobStatus.FAILED.value,
-            "error_message": str(e),
-            "updated_at": datetime.utcnow().isoformat()
+            "error_message": str(e)
         })
 
 
 def detect_scene_changes(video_path: str) -> List[float]:
+    """Detect scene changes with ffmpeg's scene filter, falling back to PySceneDetect."""
+    try:
+        proc = subprocess.run(
+            [FFMPEG_BINARY, "-hide_banner", "-nostdin", "-i", video_path, "-an",
+             "-filter:v", f"select='gt(scene,{SCENE_CHANGE_THRESHOLD})',showinfo",
+             "-f", "null", "-"],
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
+        )
+        if proc.returncode != 0:
+            raise Exception(f"ffmpeg exited with code {proc.returncode}")
+        
+        cuts = [float(t) for t in SHOWINFO_PTS_RE.findall(proc.stderr.decode(errors='ignore'))]
+        
+        # Report scene start times like PySceneDetect: the first scene starts at 0
+        return [0.0] + cuts if cuts else []
+        
+    except Exception as e:
+        print(f"ffmpeg scene detection failed, using PySceneDetect: {str(e)}")
+        return detect_scene_changes_pyscenedetect(video_path)
+
+
+def detect_scene_changes_pyscenedetect(video_path: str) -> List[float]:
     """Detect scene changes in video using PySceneDetect."""
     try:
         scene_timestamps = []
@@ -178,129 +299,170 @@ def detect_scene_changes(video_path: str) -> List[float]:
         return []
 
 
-def analyze_transcript_segments(segments: List[Dict]) -> List[Dict]:
+def analyze_transcript_segments(segments: List[Dict]) -> List[SegmentScore]:
     """Analyze transcript segments for viral potential."""
     segment_scores = []
     
+    # Score each distinct text once; repeated texts share its results
+    unique_texts = list(dict.fromkeys(segment["text"] for segment in segments))
+    text_index = {text: i for i, text in enumerate(unique_texts)}
+    
+    # Run the models over the distinct texts in batches rather than one call each
+    # Texts the models failed on get neutral sentiment and no keywords
+    sentiment_scores = [
+        0.5 if score is None else score
+        for score in sentiment_cache.map(unique_texts, calculate_sentiment_scores)
+    ]
+    segment_keywords = [
+        [] if keywords is None else keywords
+        for keywords in keyword_cache.map(unique_texts, extract_keywords_batch)
+    ]
+    word_counts = np.fromiter((len(text.split()) for text in unique_texts), dtype=np.int64, count=len(unique_texts))
+    length_scores = calculate_length_scores(word_counts).tolist()
+    
+    # Calculate the rule-based scores and titles
+    keyword_scores = [calculate_keyword_score(text) for text in unique_texts]
+    titles = [generate_segment_title(text) for text in unique_texts]
+    
     for segment in segments:
-        text = segment["text"]
-        
-        # Calculate various scores
-        keyword_score = calculate_keyword_score(text)
-        sentiment_score = calculate_sentiment_score(text)
-        length_score = calculate_length_score(text)
-        
-        # Extract keywords
-        keywords = extract_keywords(text)
-        
-        # Generate title
-        title = generate_segment_title(text)
+        i = text_index[segment["text"]]
         
         # Combined score
-        total_score = (keyword_score * 0.4) + (sentiment_score * 0.3) + (length_score * 0.3)
+        total_score = (keyword_scores[i] * 0.4) + (sentiment_scores[i] * 0.3) + (length_scores[i] * 0.3)
         
-        segment_scores.append({
-            "start_time": segment["start"],
-            "end_time": segment["end"],
-            "text": text,
-            "score": total_score,
-            "keywords": keywords,
-            "title": title,
-            "keyword_score": keyword_score,
-            "sentiment_score": sentiment_score,
-            "length_score": length_score
-        })
+        segment_scores.append(SegmentScore(
+            start_time=segment["start"],
+            end_time=segment["end"],
+            text=segment["text"],
+            score=total_score,
+            keywords=segment_keywords[i],
+            title=titles[i],
+            keyword_score=keyword_scores[i],
+            sentiment_score=sentiment_scores[i],
+            length_score=length_scores[i]
+        ))
     
     return segment_scores
 
 
 def calculate_keyword_score(text: str) -> float:
     """Calculate score based on presence of viral keywords."""
-    text_lower = text.lower()
-    score = 0
-    
-    for keyword in VIRAL_KEYWORDS:
-        if keyword in text_lower:
-            score += 1
+    # Count distinct viral keywords present as whole words
+    score = len({match.lower() for match in VIRAL_RE.findall(text)})
     
     # Normalize score (0-1)
     return min(score / 5, 1.0)
 
 
+def _positive_score(label_scores: List[Dict]) -> float:
+    """Pick the positive-emotion score out of one text's label scores."""
+    for result in label_scores:
+        if result['label'].upper() in ['POSITIVE', 'JOY', 'EXCITEMENT']:
+            return result['score']
+    
+    return 0.5  # Neutral if no positive sentiment found
+
+
 def calculate_sentiment_score(text: str) -> float:
     """Calculate sentiment score (positive emotions score higher)."""
     try:
-        results = sentiment_analyzer(text)
-        
-        # Find positive sentiment score
-        for result in results[0]:
-            if result['label'].upper() in ['POSITIVE', 'JOY', 'EXCITEMENT']:
-                return result['score']
-        
-        return 0.5  # Neutral if no positive sentiment found
+        results = sentiment_analyzer(text, truncation=True)
+        return _positive_score(results[0])
         
     except Exception as e:
         print(f"Error in sentiment analysis: {str(e)}")
         return 0.5
 
 
-def calculate_length_score(text: str) -> float:
-    """Score based on text length (ideal for short clips)."""
-    word_count = len(text.split())
+def _run_length_sorted(run: Callable[[List[str]], List[Any]], texts: List[str]) -> List[Any]:
+    """Call a batched pipeline on texts sorted by length, returning results in input order.
     
-    # Ideal range: 10-30 words (good for 15-60 second clips)
-    if 10 <= word_count <= 30:
-        return 1.0
-    elif 5 <= word_count < 10 or 30 < word_count <= 50:
-        return 0.7
-    elif word_count < 5 or word_count > 50:
-        return 0.3
+    Batches then hold texts of similar length, so little compute goes to padding.
+    """
+    # Character count tracks token count closely enough and needs no split
+    order = np.argsort([len(text) for text in texts], kind="stable")
+    results = [None] * len(texts)
+    for index, result in zip(order, run([texts[i] for i in order])):
+        results[index] = result
+    return results
+
+
+def calculate_sentiment_scores(texts: List[str]) -> List[Optional[float]]:
+    """Calculate sentiment scores for many texts with batched inference.
     
-    return 0.5
+    Returns None for every text if inference fails.
+    """
+    if not texts:
+        return []
+    
+    try:
+        results = _run_length_sorted(
+            lambda batch: sentiment_analyzer(batch, batch_size=SENTIMENT_BATCH_SIZE, truncation=True, padding=True),
+            texts
+        )
+        return [_positive_score(label_scores) for label_scores in results]
+        
+    except Exception as e:
+        print(f"Error in batched sentiment analysis: {str(e)}")
+        return [None] * len(texts)
 
 
-def extract_keywords(text: str) -> List[str]:
-    """Extract keywords using KeyBERT."""
+def calculate_length_scores(word_counts: np.ndarray) -> np.ndarray:
+    """Score texts by their word counts (ideal for short clips)."""
+    # Ideal range: 10-30 words (good for 15-60 second clips)
+    return np.select(
+        [
+            (word_counts >= 10) & (word_counts <= 30),
+            ((word_counts >= 5) & (word_counts < 10)) | ((word_counts > 30) & (word_counts <= 50))
+        ],
+        [1.0, 0.7],
+        default=0.3
+    )
+
+
+def extract_keywords(text: str) -> Optional[List[str]]:
+    """Extract keywords using KeyBERT, or None if extraction fails."""
     try:
         keywords = keybert_model.extract_keywords(
             text, 
             keyphrase_ngram_range=(1, 2), 
             stop_words='english',
-            top_k=5
+            top_n=5
         )
         return [keyword[0] for keyword in keywords]
     except Exception as e:
         print(f"Error extracting keywords: {str(e)}")
-        return []
+        return None
 
 
-def generate_segment_title(text: str) -> str:
-    """Generate a title for the segment."""
+def extract_keywords_batch(texts: List[str]) -> List[Optional[List[str]]]:
+    """Extract keywords for many texts with KeyBERT.
+    
+    Passing all documents at once lets KeyBERT embed the documents and the
+    shared candidate vocabulary in one batched encode each. If the batch
+    fails each text is retried alone, with None for the ones that fail again.
+    """
+    if not texts:
+        return []
+    
     try:
-        # Try summarization first
-        if len(text.split()) > 10:
-            summary = summarizer(text, max_length=30, min_length=5)
-            title = summary[0]['summary_text']
-        else:
-            title = text
-        
-        # Clean up title
-        title = title.strip().rstrip('.')
-        
-        # Limit length
-        if len(title) > 60:
-            title = title[:57] + "..."
-        
-        return title
-        
+        with torch.inference_mode():
+            results = keybert_model.extract_keywords(
+                texts,
+                keyphrase_ngram_range=(1, 2),
+                stop_words='english',
+                top_n=5
+            )
+        # KeyBERT unwraps the result list when given a single document
+        if len(texts) == 1:
+            results = [results]
+        return [[keyword[0] for keyword in keywords] for keywords in results]
     except Exception as e:
-        print(f"Error generating title: {str(e)}")
-        # Fallback: use first few words
-        words = text.split()[:8]
-        return " ".join(words) + ("..." if len(text.split()) > 8 else "")
+        print(f"Error extracting keywords: {str(e)}")
+        return [extract_keywords(text) for text in texts]
 
 
-def combine_analysis(segments: List[Dict], segment_scores: List[Dict], 
+def combine_analysis(segments: List[Dict], segment_scores: List[SegmentScore], 
                    scene_changes: List[float], max_highlights: int) -> List[Dict]:
     """Combine transcript analysis with scene detection to find best highlights."""
     
@@ -308,77 +470,95 @@ def combine_analysis(segments: List[Dict], segment_scores: List[Dict],
     
     # Group segments by potential clips (15-60 seconds)
     potential_clips = []
-    current_clip = []
+    clip_first = 0  # Index of the current clip's first segment
     current_start = 0
     
+    # Which segments end within 2 seconds of a scene change, computed once
+    segment_ends = np.array([score.end_time for score in segment_scores], dtype=np.float64)
+    scene_times = np.array(scene_changes, dtype=np.float64)
+    near_scene = (np.abs(segment_ends[:, None] - scene_times[None, :]) < 2).any(axis=1)
+    
     for i, segment_score in enumerate(segment_scores):
-        current_clip.append(segment_score)
-        
         # Check if we should end this potential clip
-        duration = segment_score["end_time"] - current_start
+        duration = segment_score.end_time - current_start
         
         # End clip if duration is good (15-60 seconds) or we hit a scene change
-        if (15 <= duration <= 60) or any(abs(sc - segment_score["end_time"]) < 2 for sc in scene_changes):
+        if (15 <= duration <= 60) or near_scene[i]:
             if duration >= 10:  # Minimum clip length
                 # Calculate combined score for this clip
+                current_clip = segment_scores[clip_first:i + 1]
                 clip_score = calculate_clip_score(current_clip, scene_changes)
                 
                 potential_clips.append({
                     "start_time": current_start,
-                    "end_time": segment_score["end_time"],
+                    "end_time": segment_score.end_time,
                     "duration": duration,
                     "score": clip_score,
-                    "segments": current_clip.copy(),
-                    "keywords": extract_clip_keywords(current_clip),
-                    "title": generate_clip_title(current_clip)
+                    "segment_range": (clip_first, i + 1),
+                    "keywords": extract_clip_keywords(current_clip)
                 })
             
             # Reset for next clip
-            current_clip = []
-            current_start = segment_score["end_time"] if i < len(segment_scores) - 1 else 0
+            clip_first = i + 1
+            current_start = segment_score.end_time if i < len(segment_scores) - 1 else 0
     
-    # Sort by score and take top highlights
-    potential_clips.sort(key=lambda x: x["score"], reverse=True)
+    # Select the best-scoring non-overlapping highlights
+    starts = np.array([clip["start_time"] for clip in potential_clips], dtype=np.float64)
+    ends = np.array([clip["end_time"] for clip in potential_clips], dtype=np.float64)
+    scores = np.array([clip["score"] for clip in potential_clips], dtype=np.float64)
+    selected_clips = [
+        potential_clips[i] for i in select_non_overlapping(starts, ends, scores, max_highlights)
+    ]
     
-    # Select non-overlapping highlights
     selected_highlights = []
-    for clip in potential_clips:
-        if len(selected_highlights) >= max_highlights:
-            break
-        
-        # Check for overlap with existing highlights
-        has_overlap = False
-        for existing in selected_highlights:
-            if (clip["start_time"] < existing["end_time"] and 
-                clip["end_time"] > existing["start_time"]):
-                has_overlap = True
-                break
-        
-        if not has_overlap:
-            selected_highlights.append({
-                "start_time": clip["start_time"],
-                "end_time": clip["end_time"],
-                "score": clip["score"],
-                "keywords": clip["keywords"],
-                "title": clip["title"],
-                "description": f"Duration: {clip['duration']:.1f}s"
-            })
+    for clip in selected_clips:
+        selected_highlights.append({
+            "start_time": clip["start_time"],
+            "end_time": clip["end_time"],
+            "score": clip["score"],
+            "keywords": clip["keywords"],
+            "title": generate_clip_title(segment_scores[slice(*clip["segment_range"])]),
+            "description": f"Duration: {clip['duration']:.1f}s"
+        })
     
     return selected_highlights
 
 
-def calculate_clip_score(segments: List[Dict], scene_changes: List[float]) -> float:
+def select_non_overlapping(starts: np.ndarray, ends: np.ndarray, scores: np.ndarray,
+                           max_count: int) -> List[int]:
+    """Greedily pick up to max_count non-overlapping intervals, highest score first.
+    
+    Returns indices into the input arrays, in selection order. Ties in score
+    keep their input order.
+    """
+    order = np.argsort(-scores, kind="stable")
+    selected = np.empty(max(max_count, 0), dtype=np.intp)
+    count = 0
+    
+    for i in order:
+        if count >= max_count:
+            break
+        # One vectorized overlap test against everything selected so far
+        chosen = selected[:count]
+        if not np.any((starts[i] < ends[chosen]) & (ends[i] > starts[chosen])):
+            selected[count] = i
+            count += 1
+    
+    return selected[:count].tolist()
+
+
+def calculate_clip_score(segments: List[SegmentScore], scene_changes: List[float]) -> float:
     """Calculate overall score for a potential clip."""
     if not segments:
         return 0
     
     # Average segment scores
-    avg_score = sum(seg["score"] for seg in segments) / len(segments)
+    avg_score = sum(seg.score for seg in segments) / len(segments)
     
     # Bonus for scene changes (visual interest)
     scene_bonus = 0
-    clip_start = segments[0]["start_time"]
-    clip_end = segments[-1]["end_time"]
+    clip_start = segments[0].start_time
+    clip_end = segments[-1].end_time
     
     for scene_time in scene_changes:
         if clip_start <= scene_time <= clip_end:
@@ -387,7 +567,7 @@ def calculate_clip_score(segments: List[Dict], scene_changes: List[float]) -> fl
     # Bonus for emotional peaks (high sentiment segments)
     emotion_bonus = 0
     for segment in segments:
-        if segment.get("sentiment_score", 0) > 0.8:
+        if segment.sentiment_score > 0.8:
             emotion_bonus += 0.1
     
     # Penalty for very short or very long clips
@@ -401,66 +581,54 @@ def calculate_clip_score(segments: List[Dict], scene_changes: List[float]) -> fl
     return (avg_score + scene_bonus + emotion_bonus) * duration_multiplier
 
 
-def extract_clip_keywords(segments: List[Dict]) -> List[str]:
+def extract_clip_keywords(segments: List[SegmentScore]) -> List[str]:
     """Extract combined keywords for a clip."""
     all_keywords = []
     for segment in segments:
-        all_keywords.extend(segment.get("keywords", []))
+        all_keywords.extend(segment.keywords)
     
     # Remove duplicates and return top 5
     unique_keywords = list(dict.fromkeys(all_keywords))
     return unique_keywords[:5]
 
 
-def generate_clip_title(segments: List[Dict]) -> str:
+def generate_clip_title(segments: List[SegmentScore]) -> str:
     """Generate title for a clip based on its segments."""
-    # Combine text from all segments
-    combined_text = " ".join(seg["text"] for seg in segments)
-    
-    # Find the segment with highest score for title generation
-    best_segment = max(segments, key=lambda x: x["score"])
-    
-    try:
-        # Use the best segment's text for title
-        title = generate_segment_title(best_segment["text"])
-        return title
-    except Exception:
-        # Fallback to simple approach
-        words = combined_text.split()[:6]
-        return " ".join(words) + ("..." if len(combined_text.split()) > 6 else "")
+    # Reuse the title already generated for the highest-scoring segment
+    return max(segments, key=lambda x: x.score).title
 
 
 def generate_segment_title(text: str) -> str:
     """Generate a catchy title for a text segment."""
     # Remove filler words and clean text
-    text = re.sub(r'\b(um|uh|like|you know|so|well)\b', '', text, flags=re.IGNORECASE)
-    text = re.sub(r'\s+', ' ', text).strip()
+    text = FILLER_RE.sub('', text)
+    text = WHITESPACE_RE.sub(' ', text).strip()
     
     words = text.split()
     
     if len(words) <= 8:
         return text
     
-    # Try to find a compelling phrase within the first part
-    for i in range(3, min(9, len(words))):
-        phrase = " ".join(words[:i])
-        if any(keyword in phrase.lower() for keyword in VIRAL_KEYWORDS[:20]):
-            return phrase
+    # Try to find a compelling phrase within the first part: cut after the
+    # first keyword among the first 8 words, keeping at least 3 words
+    for i, word in enumerate(words[:8]):
+        if TITLE_KEYWORD_RE.search(word):
+            return " ".join(words[:max(i + 1, 3)])
     
     # Fallback to first 6 words
     return " ".join(words[:6]) + "..."
 
 
-def is_high_energy_segment(segment: Dict) -> bool:
+def is_high_energy_segment(segment: SegmentScore) -> bool:
     """Determine if a segment has high energy/engagement."""
-    text = segment["text"].lower()
+    text = segment.text
     
-    # Check for exclamation marks, caps, viral keywords
+    # Check for exclamation marks, caps, viral keywords (the pattern ignores case)
     energy_indicators = [
-        "!" in segment["text"],
-        any(word.isupper() for word in segment["text"].split()),
-        any(keyword in text for keyword in VIRAL_KEYWORDS[:30]),
-        segment.get("sentiment_score", 0) > 0.7
+        "!" in text,
+        any(word.isupper() for word in text.split()),
+        ENERGY_KEYWORD_RE.search(text) is not None,
+        segment.sentiment_score > 0.7
     ]
     
     return sum(energy_indicators) >= 2
@@ -471,7 +639,7 @@ def calculate_viral_potential(text: str, keywords: List[str], sentiment_score: f
     base_score = sentiment_score
     
     # Keyword boost
-    viral_keyword_count = sum(1 for kw in keywords if kw.lower() in VIRAL_KEYWORDS)
+    viral_keyword_count = sum(1 for kw in keywords if kw.lower() in VIRAL_KEYWORD_SET)
     keyword_boost = min(viral_keyword_count * 0.1, 0.3)
     
     # Length penalty (too long is bad for viral content)
@@ -0,0 +1,65 @@
+import json
+import shutil
+import subprocess
+from typing import Dict, Any
+import numpy as np
+
+# Resolved once so every subprocess call skips the PATH lookup
+FFMPEG_BINARY = shutil.which("ffmpeg") or "ffmpeg"
+FFPROBE_BINARY = shutil.which("ffprobe") or "ffprobe"
+
+# Whisper models expect 16 kHz mono input
+AUDIO_SAMPLE_RATE = 16000
+
+
+def extract_audio_pcm(video_path: str, sample_rate: int = AUDIO_SAMPLE_RATE) -> np.ndarray:
+    """Decode a video's audio track with ffmpeg straight into a float32 mono array."""
+    proc = subprocess.run(
+        [FFMPEG_BINARY, "-nostdin", "-loglevel", "error", "-i", video_path,
+         "-vn", "-f", "s16le", "-ac", "1", "-ar", str(sample_rate), "pipe:1"],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+    )
+    if proc.returncode != 0:
+        raise Exception(f"Audio extraction failed: {proc.stderr.decode(errors='ignore').strip()}")
+    return np.frombuffer(proc.stdout, np.int16).astype(np.float32) / 32768.0
+
+
+def _parse_frame_rate(rate: str) -> float:
+    """Turn an ffprobe rate such as '30000/1001' into frames per second."""
+    num, _, den = (rate or "0").partition("/")
+    try:
+        return float(num) / float(den or 1)
+    except (ValueError, ZeroDivisionError):
+        return 0.0
+
+
+def probe_video(path: str) -> Dict[str, Any]:
+    """Read duration, display size, frame rate and audio presence with ffprobe, without decoding frames."""
+    proc = subprocess.run(
+        [FFPROBE_BINARY, "-v", "quiet", "-print_format", "json", "-show_streams", "-show_format", path],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+    )
+    if proc.returncode != 0:
+        raise Exception(f"ffprobe failed: {proc.stderr.decode(errors='ignore').strip()}")
+    
+    info = json.loads(proc.stdout)
+    streams = info.get("streams", [])
+    video = next((s for s in streams if s.get("codec_type") == "video"), {})
+    width, height = int(video.get("width", 0)), int(video.get("height", 0))
+    
+    # ffmpeg auto-rotates on decode, so report the size frames come out at
+    rotation = video.get("tags", {}).get("rotate")
+    for side_data in video.get("side_data_list", []):
+        rotation = side_data.get("rotation", rotation)
+    if rotation is not None and abs(int(float(rotation))) % 180 == 90:
+        width, height = height, width
+    
+    return {
+        "duration": float(info.get("format", {}).get("duration") or video.get("duration") or 0),
+        "width": width,
+        "height": height,
+        "fps": _parse_frame_rate(video.get("avg_frame_rate") or video.get("r_frame_rate")),
+        "has_audio": any(s.get("codec_type") == "audio" for s in streams)
+    }
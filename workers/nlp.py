@@ -0,0 +1,46 @@
+import os
+import sys
+from typing import Optional
+from transformers import pipeline, AutoTokenizer
+try:
+    import onnxruntime
+    from optimum.onnxruntime import ORTModelForSequenceClassification
+    OPTIMUM_AVAILABLE = True
+except ImportError:
+    OPTIMUM_AVAILABLE = False
+
+# Add shared directory to path
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'shared'))
+
+from utils import cpu_threads_per_worker
+
+# File name optimum's quantizer writes for a classification model
+ONNX_QUANTIZED_FILE = "model_quantized.onnx"
+
+
+def load_text_classifier(task: str, model_name: Optional[str], onnx_dir: Optional[str] = None,
+                         device: int = -1, torch_dtype=None, **kwargs):
+    """Load a classification pipeline, preferring a quantized ONNX Runtime export on CPU.
+
+    ``onnx_dir`` holds an export made with `optimum-cli export onnx` followed
+    by `optimum-cli onnxruntime quantize`. ONNX Runtime gets this worker
+    process's share of the cores. Without an export, or when ``device``
+    is a GPU, the PyTorch model is loaded instead.
+    """
+    if OPTIMUM_AVAILABLE and device == -1 and onnx_dir and os.path.isdir(onnx_dir):
+        session_options = onnxruntime.SessionOptions()
+        session_options.intra_op_num_threads = cpu_threads_per_worker()
+
+        model_kwargs = {}
+        if os.path.exists(os.path.join(onnx_dir, ONNX_QUANTIZED_FILE)):
+            model_kwargs["file_name"] = ONNX_QUANTIZED_FILE
+
+        model = ORTModelForSequenceClassification.from_pretrained(
+            onnx_dir, session_options=session_options, **model_kwargs
+        )
+        tokenizer = AutoTokenizer.from_pretrained(onnx_dir)
+        return pipeline(task, model=model, tokenizer=tokenizer, **kwargs)
+
+    if model_name is not None:
+        kwargs["model"] = model_name
+    return pipeline(task, device=device, torch_dtype=torch_dtype, **kwargs)
@@ -2,9 +2,16 @@ import os
 import sys
 import tempfile
 import json
+from dataclasses import asdict, is_dataclass
 from datetime import datetime
+import torch
 from faster_whisper import WhisperModel
-import moviepy.editor as mp
+try:
+    # Batched decoding of VAD chunks, available from faster-whisper 1.1
+    from faster_whisper import BatchedInferencePipeline
+    BATCHED_WHISPER_AVAILABLE = True
+except ImportError:
+    BATCHED_WHISPER_AVAILABLE = False
 try:
     import whisperx
     WHISPERX_AVAILABLE = True
@@ -16,15 +23,26 @@ except ImportError:
 sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'shared'))
 
 from database import Database
-from utils import generate_id
+from utils import generate_id, get_temp_dir, cpu_threads_per_worker
 from schemas import JobStatus
+from media import extract_audio_pcm
 
 
 db = Database()
 
-# Initialize Whisper model (using CPU-optimized version)
+# Initialize Whisper model: fp16 on GPU, int8 on CPU
 # Using 'base' model as a balance between speed and accuracy
-whisper_model = WhisperModel("base", device="cpu", compute_type="int8")
+WHISPER_DEVICE = "cuda" if torch.cuda.is_available() else "cpu"
+WHISPER_COMPUTE_TYPE = "float16" if WHISPER_DEVICE == "cuda" else "int8"
+# CTranslate2 defaults to 4 CPU threads; use this process's share of the
+# cores unless overridden
+WHISPER_CPU_THREADS = int(os.environ.get("WHISPER_CPU_THREADS", cpu_threads_per_worker()))
+whisper_model = WhisperModel("base", device=WHISPER_DEVICE, compute_type=WHISPER_COMPUTE_TYPE,
+                             cpu_threads=WHISPER_CPU_THREADS)
+
+# Decode speech chunks in parallel batches when supported; lower on small GPUs
+WHISPER_BATCH_SIZE = int(os.environ.get("WHISPER_BATCH_SIZE", "16"))
+batched_whisper_model = BatchedInferencePipeline(model=whisper_model) if BATCHED_WHISPER_AVAILABLE else None
 
 
 def transcribe_video(video_id: str, job_id: str, use_whisperx: bool = True):
@@ -44,23 +62,17 @@ def transcribe_video(video_id: str, job_id: str, use_whisperx: bool = True):
         if not video:
             raise Exception("Video not found")
         
-        # Download video from storage
-        file_data = db.storage.download_file(video["file_path"])
-        
-        # Save to temporary file
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.mp4') as temp_video:
-            temp_video.write(file_data)
+        # Stream the video to a temp file, on tmpfs when there is room
+        with tempfile.NamedTemporaryFile(delete=False, suffix='.mp4',
+                                         dir=get_temp_dir(video.get("file_size") or 0)) as temp_video:
             temp_video_path = temp_video.name
         
-        # Extract audio using moviepy
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.wav') as temp_audio:
-            temp_audio_path = temp_audio.name
-        
         try:
-            # Extract audio from video
-            video_clip = mp.VideoFileClip(temp_video_path)
-            audio_clip = video_clip.audio
-            audio_clip.write_audiofile(temp_audio_path, verbose=False, logger=None)
+            with open(temp_video_path, 'wb') as temp_video:
+                db.storage.download_file_to(video["file_path"], temp_video)
+            
+            # Decode 16 kHz mono audio straight into memory; no intermediate WAV
+            audio = extract_audio_pcm(temp_video_path)
             
             # Update progress
             db.update_job(job_id, {
@@ -69,38 +81,36 @@ def transcribe_video(video_id: str, job_id: str, use_whisperx: bool = True):
             })
             
             # Transcribe audio
-            segments, info = whisper_model.transcribe(
-                temp_audio_path, 
-                beam_size=5,
-                word_timestamps=True,
-                vad_filter=True  # Voice activity detection
-            )
+            if batched_whisper_model is not None:
+                segments, info = batched_whisper_model.transcribe(
+                    audio,
+                    batch_size=WHISPER_BATCH_SIZE,
+                    beam_size=5,
+                    word_timestamps=True,
+                    vad_filter=True  # Voice activity detection
+                )
+            else:
+                segments, info = whisper_model.transcribe(
+                    audio,
+                    beam_size=5,
+                    word_timestamps=True,
+                    vad_filter=True  # Voice activity detection
+                )
             
             # Process segments with word-level timestamps
             transcript_segments = []
-            full_text = ""
+            text_chunks = []
             
             for segment in segments:
-                segment_data = {
+                transcript_segments.append({
                     "start": segment.start,
                     "end": segment.end,
                     "text": segment.text.strip(),
-                    "words": []
-                }
-                
-                # Add word-level timestamps if available
-                if hasattr(segment, 'words') and segment.words:
-                    for word in segment.words:
-                        word_data = {
-                            "start": word.start,
-                            "end": word.end,
-                            "word": word.word,
-                            "probability": word.probability
-                        }
-                        segment_data["words"].append(word_data)
-                
-                transcript_segments.append(segment_data)
-                full_text += segment.text + " "
+                    "words": [word_to_dict(word) for word in getattr(segment, 'words', None) or ()]
+                })
+                text_chunks.append(segment.text)
+            
+            full_text = " ".join(text_chunks)
             
             # Update progress
             db.update_job(job_id, {
@@ -136,14 +146,6 @@ def transcribe_video(video_id: str, job_id: str, use_whisperx: bool = True):
             # Clean up temp files
             if os.path.exists(temp_video_path):
                 os.remove(temp_video_path)
-            if os.path.exists(temp_audio_path):
-                os.remove(temp_audio_path)
-            
-            # Close clips to free memory
-            if 'audio_clip' in locals():
-                audio_clip.close()
-            if 'video_clip' in locals():
-                video_clip.close()
                 
     except Exception as e:
         print(f"Error transcribing video {video_id}: {str(e)}")
@@ -154,6 +156,14 @@ def transcribe_video(video_id: str, job_id: str, use_whisperx: bool = True):
         })
 
 
+def word_to_dict(word) -> dict:
+    """Convert a faster-whisper Word (start, end, word, probability) to a dict.
+
+    Words are NamedTuples before faster-whisper 1.1 and dataclasses from 1.1 on.
+    """
+    return asdict(word) if is_dataclass(word) else word._asdict()
+
+
 def detect_highlights_auto(video_id: str):
     """Automatically start highlight detection after transcription."""
     try:
@@ -3,11 +3,14 @@ import sys
 import tempfile
 from datetime import datetime
 import subprocess
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, Dict, List, Optional, Tuple
 import moviepy.editor as mp
 from moviepy.video.fx import resize
 from moviepy.video.tools.subtitles import SubtitlesClip
 import cv2
 import numpy as np
+from scipy.ndimage import gaussian_filter1d
 
 # Add shared directory to path
 sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'shared'))
@@ -15,151 +18,626 @@ sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'shared'))
 from database import Database, Storage
 from utils import generate_id, calculate_aspect_ratio_dimensions
 from schemas import JobStatus
+from progress import ProgressReporter
+from media import FFMPEG_BINARY, probe_video
 
 
 db = Database()
 storage = Storage(db.supabase)
 
 
+# Hardware H.264 encoders looked for in the ffmpeg build
+HARDWARE_ENCODERS = ("h264_nvenc", "h264_qsv", "h264_vaapi", "h264_videotoolbox")
+
+_ENCODER_CAPS = None
+
+
+def get_encoder_caps() -> Dict[str, bool]:
+    """Probe once per process which hardware H.264 encoders ffmpeg can use.
+    
+    Call at worker start-up so the probe does not land on the first job.
+    """
+    global _ENCODER_CAPS
+    if _ENCODER_CAPS is not None:
+        return _ENCODER_CAPS
+    
+    try:
+        encoders = subprocess.run(
+            [FFMPEG_BINARY, "-hide_banner", "-encoders"],
+            capture_output=True, text=True, timeout=30
+        ).stdout
+    except (OSError, subprocess.SubprocessError):
+        encoders = ""
+    caps = {name: name in encoders for name in HARDWARE_ENCODERS}
+    
+    if caps["h264_nvenc"]:
+        # Being listed only means ffmpeg was built with NVENC; a tiny test
+        # encode confirms a usable GPU and driver are present
+        try:
+            result = subprocess.run(
+                [FFMPEG_BINARY, "-hide_banner", "-loglevel", "error",
+                 "-f", "lavfi", "-i", "color=size=256x256:duration=0.1",
+                 "-c:v", "h264_nvenc", "-f", "null", "-"],
+                capture_output=True,
+                timeout=30
+            )
+            caps["h264_nvenc"] = result.returncode == 0
+        except (OSError, subprocess.SubprocessError):
+            caps["h264_nvenc"] = False
+    
+    _ENCODER_CAPS = caps
+    return caps
+
+
+# Encoder targets per export resolution: NVENC constant quality (cq) or
+# x264 CRF, with a peak bitrate cap so short, busy clips do not balloon
+QUALITY_LADDER = {
+    "1080p": {"cq": 22, "crf": 21, "preset": "p5", "maxrate": "8M", "bufsize": "16M"},
+    "720p": {"cq": 24, "crf": 23, "preset": "p4", "maxrate": "5M", "bufsize": "10M"},
+    "480p": {"cq": 26, "crf": 25, "preset": "p4", "maxrate": "2500k", "bufsize": "5M"},
+}
+DEFAULT_QUALITY = "720p"
+
+# Lifetime of the signed URL ffmpeg reads the original video from, in seconds
+SOURCE_URL_EXPIRY = 3600
+
+# Clips of at least two chunks are split into parallel encodes of no less
+# than this many seconds each, then stitched together without re-encoding
+EXPORT_CHUNK_SECONDS = float(os.environ.get("EXPORT_CHUNK_SECONDS", "5"))
+
+# Concurrent chunk encodes; keep within the GPU's NVENC session limit
+EXPORT_ENCODE_SESSIONS = int(os.environ.get("EXPORT_ENCODE_SESSIONS", "2"))
+
+# Fonts are bundled so burned-in text renders the same on every host
+ASSETS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "assets")
+WATERMARK_FONT = os.environ.get("WATERMARK_FONT", os.path.join(ASSETS_DIR, "DejaVuSans-Bold.ttf"))
+WATERMARK_TEXT = "ViralClips.ai"
+
+# Every export is written with the same audio format, frame rate handling
+# and MP4 timescale, so separately encoded pieces (parallel parts, the
+# intro card) can be joined with stream copy
+EXPORT_AUDIO_RATE = 48000
+EXPORT_AUDIO_CHANNELS = 2
+EXPORT_TIMESCALE = 90000
+AUDIO_ENCODE_ARGS = ["-c:a", "aac", "-ar", str(EXPORT_AUDIO_RATE), "-ac", str(EXPORT_AUDIO_CHANNELS)]
+MP4_OUTPUT_ARGS = ["-video_track_timescale", str(EXPORT_TIMESCALE), "-movflags", "+faststart"]
+
+# Branding card that opens free-tier exports; rendered once per output
+# format and kept for later jobs
+INTRO_TEXT = "Made with ViralClips.ai"
+INTRO_SECONDS = 1.0
+INTRO_CACHE_DIR = os.environ.get("INTRO_CACHE_DIR", os.path.join(tempfile.gettempdir(), "viralclips-intro"))
+
+# mjpeg quantizer for thumbnails; 3 is roughly JPEG quality 85
+THUMBNAIL_JPEG_QSCALE = 3
+
+# Gaussian smoothing of the face-tracking crop trajectory, in keyframes
+SMART_CROP_SIGMA = float(os.environ.get("SMART_CROP_SIGMA", "2"))
+
+
+def video_encoder_settings(quality: str) -> Tuple[str, str, List[str]]:
+    """Pick the video codec, preset and extra ffmpeg arguments for an export.
+    
+    ``quality`` is a QUALITY_LADDER key, i.e. the clip's resolution.
+    """
+    rung = QUALITY_LADDER.get(quality, QUALITY_LADDER[DEFAULT_QUALITY])
+    rate_cap = ["-maxrate", rung["maxrate"], "-bufsize", rung["bufsize"]]
+    
+    if get_encoder_caps()["h264_nvenc"]:
+        # Constant-quality VBR on NVENC; lower cq means higher quality
+        return "h264_nvenc", rung["preset"], ["-rc", "vbr", "-cq", str(rung["cq"]), "-b:v", "0", *rate_cap]
+    
+    return "libx264", "veryfast", ["-crf", str(rung["crf"]), *rate_cap]
+
+
+def _run_ffmpeg(command: List[str], on_progress: Optional[Callable[[float], None]] = None):
+    """Run an ffmpeg command, raising with its error output on failure.
+    
+    When ``on_progress`` is given it is called with the output position in
+    seconds as ffmpeg reports it.
+    """
+    if on_progress is None:
+        result = subprocess.run(command, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        if result.returncode != 0:
+            raise Exception(f"ffmpeg export failed: {result.stderr.decode(errors='ignore').strip()}")
+        return
+    
+    # Progress arrives as key=value lines on stdout; errors go to a file so a
+    # full stderr pipe can never stall ffmpeg
+    command = [command[0], "-progress", "pipe:1", "-nostats", *command[1:]]
+    with tempfile.TemporaryFile() as errors:
+        process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=errors, text=True)
+        for line in process.stdout:
+            key, _, value = line.strip().partition("=")
+            if key == "out_time_us" and value.isdigit():
+                on_progress(int(value) / 1_000_000)
+        process.wait()
+        
+        if process.returncode != 0:
+            errors.seek(0)
+            raise Exception(f"ffmpeg export failed: {errors.read().decode(errors='ignore').strip()}")
+
+
+def export_frame_rate(fps: float) -> str:
+    """Constant output frame rate for an export, from the source's probed rate."""
+    return f"{round(fps or 30, 3):g}"
+
+
+def _encode_command(input_path: str, output_path: str, start: float, duration: float,
+                    video_filter: str, quality: str, frame_rate: str, audio: bool = True) -> List[str]:
+    """Build the ffmpeg command that cuts, filters and encodes one span of the input."""
+    codec, preset, encoder_params = video_encoder_settings(quality)
+    
+    command = [FFMPEG_BINARY, "-y", "-nostdin", "-loglevel", "error"]
+    if codec == "h264_nvenc":
+        # Decode on the GPU too; frames come back to system memory for the filters
+        command += ["-hwaccel", "cuda"]
+    # -ss before -i seeks the demuxer to the keyframe before ``start``, so
+    # nothing earlier is decoded; because the video is re-encoded, ffmpeg
+    # drops the frames up to ``start`` itself and the cut stays frame-exact
+    # without a separate pre-roll and output-side seek
+    command += [
+        "-ss", f"{start:.3f}", "-i", input_path, "-t", f"{duration:.3f}",
+        "-vf", video_filter, "-r", frame_rate,
+        "-c:v", codec, "-preset", preset, *encoder_params, "-pix_fmt", "yuv420p"
+    ]
+    command += AUDIO_ENCODE_ARGS if audio else ["-an"]
+    command += [*MP4_OUTPUT_ARGS, output_path]
+    return command
+
+
+def render_clip(input_path: str, output_path: str, start: float, end: float,
+                video_filter: str, quality: str, frame_rate: str,
+                on_progress: Optional[Callable[[float], None]] = None):
+    """Cut, filter and encode a clip with ffmpeg.
+    
+    ``video_filter`` sees timestamps relative to the clip start and output
+    is resampled to the constant ``frame_rate``. Long clips
+    are split into one contiguous part per encode session, which encode in
+    parallel. ``on_progress`` receives the finished fraction of the encode,
+    from 0 to 1.
+    """
+    report = on_progress or (lambda fraction: None)
+    duration = end - start
+    if EXPORT_ENCODE_SESSIONS < 2 or duration < 2 * EXPORT_CHUNK_SECONDS:
+        _run_ffmpeg(
+            _encode_command(input_path, output_path, start, duration, video_filter, quality, frame_rate),
+            lambda seconds: report(min(seconds / duration, 1.0)) if duration > 0 else None
+        )
+        return
+    
+    # One part per session rather than many short chunks: every ffmpeg
+    # launch pays for process start-up and CUDA/NVENC initialization, so
+    # each process should encode as much of the clip as it can
+    parts = min(EXPORT_ENCODE_SESSIONS, int(duration // EXPORT_CHUNK_SECONDS))
+    bounds = np.linspace(0, duration, parts + 1)
+    
+    with tempfile.TemporaryDirectory() as chunk_dir:
+        commands = []
+        chunk_paths = []
+        for i, (chunk_start, chunk_end) in enumerate(zip(bounds[:-1], bounds[1:])):
+            chunk_path = os.path.join(chunk_dir, f"chunk_{i:04d}.mp4")
+            # Shift the chunk onto the clip's timeline for time-based filters,
+            # then restart its own timestamps at zero for concatenation
+            chunk_filter = f"setpts=PTS+{chunk_start:.3f}/TB,{video_filter},setpts=PTS-STARTPTS"
+            commands.append(_encode_command(
+                input_path, chunk_path, start + chunk_start, chunk_end - chunk_start,
+                chunk_filter, quality, frame_rate, audio=False
+            ))
+            chunk_paths.append(chunk_path)
+        
+        # Parts encode in parallel; progress is the sum of what each has done
+        encoded = [0.0] * len(commands)
+        
+        def track(index: int) -> Callable[[float], None]:
+            def on_seconds(seconds: float):
+                encoded[index] = seconds
+                report(min(sum(encoded) / duration, 1.0))
+            return on_seconds
+        
+        with ThreadPoolExecutor(max_workers=EXPORT_ENCODE_SESSIONS) as executor:
+            futures = [executor.submit(_run_ffmpeg, command, track(i)) for i, command in enumerate(commands)]
+            for future in as_completed(futures):
+                future.result()
+        
+        list_path = os.path.join(chunk_dir, "chunks.txt")
+        with open(list_path, "w") as f:
+            f.writelines(f"file '{path}'\n" for path in chunk_paths)
+        
+        # Stitch the chunks without re-encoding and encode the audio once,
+        # so there are no AAC priming gaps at chunk boundaries
+        _run_ffmpeg([
+            FFMPEG_BINARY, "-y", "-nostdin", "-loglevel", "error",
+            "-f", "concat", "-safe", "0", "-i", list_path,
+            "-ss", f"{start:.3f}", "-t", f"{duration:.3f}", "-i", input_path,
+            "-map", "0:v", "-map", "1:a?", "-c:v", "copy", *AUDIO_ENCODE_ARGS,
+            *MP4_OUTPUT_ARGS, output_path
+        ])
+
+
+def get_intro_card(width: int, height: int, frame_rate: str, quality: str) -> str:
+    """Return the path of the branding intro card for an output format, rendering it on first use.
+    
+    The card is encoded with the export's video settings, frame rate, audio
+    format and timescale so the two can be concatenated with stream copy.
+    """
+    codec, preset, encoder_params = video_encoder_settings(quality)
+    intro_path = os.path.join(
+        INTRO_CACHE_DIR,
+        f"intro_{width}x{height}_{frame_rate}fps_{codec}_{quality}_"
+        f"{EXPORT_AUDIO_RATE}hz{EXPORT_AUDIO_CHANNELS}ch_{EXPORT_TIMESCALE}.mp4"
+    )
+    if os.path.exists(intro_path):
+        return intro_path
+    
+    os.makedirs(INTRO_CACHE_DIR, exist_ok=True)
+    # Render beside the final path and rename, so concurrent workers never
+    # pick up a half-written card
+    with tempfile.NamedTemporaryFile(delete=False, suffix=".mp4", dir=INTRO_CACHE_DIR) as temp_card:
+        temp_path = temp_card.name
+    try:
+        _run_ffmpeg([
+            FFMPEG_BINARY, "-y", "-nostdin", "-loglevel", "error",
+            "-f", "lavfi", "-i", f"color=c=black:s={width}x{height}:r={frame_rate}:d={INTRO_SECONDS}",
+            "-f", "lavfi", "-i", f"anullsrc=r={EXPORT_AUDIO_RATE}:cl=stereo",
+            "-t", f"{INTRO_SECONDS}",
+            "-vf", f"drawtext=fontfile='{WATERMARK_FONT}':text='{INTRO_TEXT}':"
+                   "fontsize=40:fontcolor=white:x=(w-tw)/2:y=(h-th)/2",
+            "-r", frame_rate,
+            "-c:v", codec, "-preset", preset, *encoder_params, "-pix_fmt", "yuv420p",
+            *AUDIO_ENCODE_ARGS, *MP4_OUTPUT_ARGS, temp_path
+        ])
+        os.replace(temp_path, intro_path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+    
+    return intro_path
+
+
+def prepend_intro(intro_path: str, clip_path: str, output_path: str, quality: str, has_audio: bool):
+    """Join the intro card and a rendered clip.
+    
+    Both are encoded with matching parameters, so the concat demuxer can
+    stream-copy the video. If that fails, the concat filter decodes both
+    inputs and re-encodes the join. Without source audio the intro's
+    silence is dropped too, so the output has no half-length audio track.
+    """
+    with tempfile.NamedTemporaryFile("w", delete=False, suffix=".txt") as list_file:
+        list_file.write(f"file '{intro_path}'\nfile '{clip_path}'\n")
+        list_path = list_file.name
+    
+    audio_args = AUDIO_ENCODE_ARGS if has_audio else ["-an"]
+    try:
+        _run_ffmpeg([
+            FFMPEG_BINARY, "-y", "-nostdin", "-loglevel", "error",
+            "-f", "concat", "-safe", "0", "-i", list_path,
+            "-c:v", "copy", *audio_args, *MP4_OUTPUT_ARGS, output_path
+        ])
+    except Exception as e:
+        print(f"Stream-copy intro join failed, re-encoding: {str(e)}")
+        codec, preset, encoder_params = video_encoder_settings(quality)
+        if has_audio:
+            graph, maps = "[0:v][0:a][1:v][1:a]concat=n=2:v=1:a=1[v][a]", ["-map", "[v]", "-map", "[a]"]
+        else:
+            graph, maps = "[0:v][1:v]concat=n=2:v=1:a=0[v]", ["-map", "[v]"]
+        _run_ffmpeg([
+            FFMPEG_BINARY, "-y", "-nostdin", "-loglevel", "error",
+            "-i", intro_path, "-i", clip_path, "-filter_complex", graph, *maps,
+            "-c:v", codec, "-preset", preset, *encoder_params, "-pix_fmt", "yuv420p",
+            *audio_args, *MP4_OUTPUT_ARGS, output_path
+        ])
+    finally:
+        os.remove(list_path)
+
+
 def export_clip(clip_id: str, include_subtitles: bool, job_id: str):
     """Export a highlight as a video clip."""
+    # Progress is written in the background; only the final status blocks
+    reporter = ProgressReporter(db, job_id)
     try:
         print(f"Starting clip export for {clip_id}")
         
         # Update job status
-        db.update_job(job_id, {
-            "status": JobStatus.PROCESSING.value,
-            "progress": 10,
-            "updated_at": datetime.utcnow().isoformat()
-        })
+        reporter.set(10, status=JobStatus.PROCESSING.value)
         
-        # Get clip and related data
-        clip = db.get_clip(clip_id)
+        # Get clip and related data in a single round-trip
+        clip = db.get_clip_bundle(clip_id)
         if not clip:
             raise Exception("Clip not found")
         
-        highlight = db.get_highlights(clip["video_id"])
-        highlight = next((h for h in highlight if h["id"] == clip["highlight_id"]), None)
+        highlight = clip.pop("highlight", None)
         if not highlight:
             raise Exception("Highlight not found")
         
-        video = db.get_video(clip["video_id"])
+        video = clip.pop("video", None)
         if not video:
             raise Exception("Video not found")
         
-        # Download original video
-        video_data = storage.download_file(video["file_path"])
-        
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.mp4') as temp_video:
-            temp_video.write(video_data)
-            temp_video_path = temp_video.name
+        # Export video to a temp file
+        with tempfile.NamedTemporaryFile(delete=False, suffix='.mp4') as output_file:
+            output_path = output_file.name
+        ass_path = None
+        crop_script_path = None
+        main_path = None
         
         try:
-            # Load video clip
-            with mp.VideoFileClip(temp_video_path) as original_clip:
-                # Extract highlight segment
-                start_time = highlight["start_time"]
-                end_time = highlight["end_time"]
-                
-                # Add 1-2 seconds padding for better context
-                padded_start = max(0, start_time - 1)
-                padded_end = min(original_clip.duration, end_time + 1)
-                
-                highlight_clip = original_clip.subclip(padded_start, padded_end)
-                
-                # Update progress
-                db.update_job(job_id, {
-                    "progress": 30,
-                    "updated_at": datetime.utcnow().isoformat()
-                })
-                
-                # Apply aspect ratio conversion
-                formatted_clip = apply_aspect_ratio(highlight_clip, clip["export_format"])
-                
-                # Update progress
-                db.update_job(job_id, {
-                    "progress": 50,
-                    "updated_at": datetime.utcnow().isoformat()
-                })
-                
-                # Add subtitles if requested
-                if include_subtitles:
-                    transcript = db.get_transcript(clip["video_id"])
-                    if transcript:
-                        formatted_clip = add_subtitles(formatted_clip, transcript, start_time, end_time)
-                
-                # Update progress
-                db.update_job(job_id, {
-                    "progress": 70,
-                    "updated_at": datetime.utcnow().isoformat()
-                })
-                
-                # Add watermark for free users
-                if clip["has_watermark"]:
-                    formatted_clip = add_watermark(formatted_clip)
-                
-                # Update progress
-                db.update_job(job_id, {
-                    "progress": 80,
-                    "updated_at": datetime.utcnow().isoformat()
-                })
-                
-                # Export video
-                with tempfile.NamedTemporaryFile(delete=False, suffix='.mp4') as output_file:
-                    output_path = output_file.name
-                
-                # Set quality based on subscription
-                quality = "high" if clip["resolution"] == "1080p" else "medium"
-                
-                formatted_clip.write_videofile(
-                    output_path,
-                    codec='libx264',
-                    audio_codec='aac',
-                    temp_audiofile='temp-audio.m4a',
-                    remove_temp=True,
-                    verbose=False,
-                    logger=None,
-                    preset='medium' if quality == "high" else 'fast'
-                )
-                
-                # Upload to storage
-                with open(output_path, 'rb') as f:
-                    output_data = f.read()
-                    storage.upload_file(clip["file_path"], output_data)
-                
-                # Update clip record
-                file_size = len(output_data)
-                db.update_clip(clip_id, {
-                    "file_size": file_size,
-                    "status": JobStatus.COMPLETED.value
-                })
-                
-                # Update job as completed
-                db.update_job(job_id, {
-                    "status": JobStatus.COMPLETED.value,
-                    "progress": 100,
-                    "metadata": {"output_file_size": file_size},
-                    "updated_at": datetime.utcnow().isoformat()
-                })
-                
-                print(f"Clip export completed for {clip_id}")
-                
+            # Encoder targets follow the clip's resolution
+            quality = clip["resolution"]
+            
+            start_time = highlight["start_time"]
+            end_time = highlight["end_time"]
+            
+            # Crop, scale, burn in subtitles and the watermark, and encode in
+            # one ffmpeg pass. ffmpeg reads the original straight from storage,
+            # seeking with HTTP range requests, so only the highlight's span
+            # is fetched
+            source_url = storage.create_signed_url(video["file_path"], SOURCE_URL_EXPIRY)
+            metadata = probe_video(source_url)
+            
+            # Add 1-2 seconds padding for better context
+            padded_start = max(0, start_time - 1)
+            padded_end = min(metadata["duration"], end_time + 1)
+            
+            # Update progress
+            reporter.set(30)
+            
+            # Follow the subject when face tracking has run on this video
+            analysis = video.get("metadata") or {}
+            regions = (analysis.get("crop_regions") or {}).get(clip["export_format"])
+            dimensions = analysis.get("video_dimensions") or {}
+            crop_filter = None
+            if regions and (dimensions.get("width"), dimensions.get("height")) == (metadata["width"], metadata["height"]):
+                smart_crop = build_smart_crop_filter(regions, padded_start, padded_end - padded_start)
+                if smart_crop:
+                    crop_filter, crop_script_path = smart_crop
+            
+            video_filter = build_aspect_filter(
+                metadata["width"], metadata["height"], clip["export_format"], crop_filter
+            )
+            output_width, output_height = aspect_output_size(
+                metadata["width"], metadata["height"], clip["export_format"]
+            )
+            
+            # Subtitles are rasterized by libass inside the same filtergraph
+            if include_subtitles:
+                transcript = db.get_transcript(clip["video_id"])
+                segments = clip_subtitle_segments(
+                    transcript["segments"], padded_start, padded_end - padded_start
+                ) if transcript else []
+                if segments:
+                    ass_path = build_ass_file(segments, output_width, output_height)
+                    video_filter += f",subtitles=filename='{ass_path}':fontsdir='{ASSETS_DIR}'"
+            
+            # Add watermark for free users
+            if clip["has_watermark"]:
+                video_filter += "," + build_watermark_filter()
+            
+            # Free-tier exports open with a branding card, rendered once per
+            # output format and joined to the clip without re-encoding
+            frame_rate = export_frame_rate(metadata["fps"])
+            if clip["has_watermark"]:
+                intro_path = get_intro_card(output_width, output_height, frame_rate, quality)
+                main_path = os.path.splitext(output_path)[0] + "_main.mp4"
+            
+            # Encoding covers progress 30-80, following ffmpeg's own reports
+            render_clip(
+                source_url, main_path or output_path, padded_start, padded_end, video_filter, quality,
+                frame_rate, on_progress=lambda fraction: reporter.set(30 + int(50 * fraction))
+            )
+            
+            if main_path:
+                prepend_intro(intro_path, main_path, output_path, quality, metadata["has_audio"])
+            
+            # Stream the upload from disk rather than reading the clip into memory
+            file_size = os.path.getsize(output_path)
+            with open(output_path, 'rb') as f:
+                storage.upload_file(clip["file_path"], f)
+            
+            # Update clip record
+            db.update_clip(clip_id, {
+                "file_size": file_size,
+                "status": JobStatus.COMPLETED.value
+            })
+            
+            # Update job as completed
+            reporter.finish({
+                "status": JobStatus.COMPLETED.value,
+                "progress": 100,
+                "metadata": {"output_file_size": file_size}
+            })
+            
+            print(f"Clip export completed for {clip_id}")
+            
         finally:
             # Clean up temp files
-            if os.path.exists(temp_video_path):
-                os.remove(temp_video_path)
-            if 'output_path' in locals() and os.path.exists(output_path):
+            if ass_path and os.path.exists(ass_path):
+                os.remove(ass_path)
+            if crop_script_path and os.path.exists(crop_script_path):
+                os.remove(crop_script_path)
+            if main_path and os.path.exists(main_path):
+                os.remove(main_path)
+            if os.path.exists(output_path):
                 os.remove(output_path)
             
     except Exception as e:
         print(f"Error exporting clip {clip_id}: {str(e)}")
-        db.update_job(job_id, {
+        reporter.finish({
             "status": JobStatus.FAILED.value,
-            "error_message": str(e),
-            "updated_at": datetime.utcnow().isoformat()
+            "error_message": str(e)
         })
 
 
+def aspect_output_size(original_width: int, original_height: int, target_format: str) -> Tuple[int, int]:
+    """Return the (width, height) apply_aspect_ratio produces for a format."""
+    if target_format == "9:16":
+        target_width = 1080 if original_width >= 1080 else original_width
+        return target_width, int(target_width * 16 / 9)
+    if target_format == "1:1":
+        side = min(1080, min(original_width, original_height))
+        return side, side
+    target_height = 720 if original_height >= 720 else original_height
+    return int(target_height * 16 / 9), target_height
+
+
+def build_aspect_filter(original_width: int, original_height: int, target_format: str,
+                        crop_filter: Optional[str] = None) -> str:
+    """Build one ffmpeg crop+scale filter chain for an aspect ratio conversion.
+    
+    Uses the same geometry as apply_aspect_ratio. ``crop_filter`` replaces
+    the centred crop, e.g. with a smart crop from build_smart_crop_filter.
+    """
+    filters = []
+    
+    if crop_filter:
+        filters.append(crop_filter)
+        
+    elif target_format == "9:16":
+        # Vertical format (TikTok/Instagram Reels): crop to center if too wide
+        if original_width / original_height > 9 / 16:
+            half_width = int(original_height * 9 / 16) // 2
+            filters.append(f"crop={half_width * 2}:{original_height}:{original_width // 2 - half_width}:0")
+        
+    elif target_format == "1:1":
+        # Square format (Instagram Post): crop to square
+        if original_width > original_height:
+            half = original_height // 2
+            filters.append(f"crop={half * 2}:{original_height}:{original_width // 2 - half}:0")
+        elif original_height > original_width:
+            half = original_width // 2
+            filters.append(f"crop={original_width}:{half * 2}:0:{original_height // 2 - half}")
+        
+    else:  # "16:9"
+        # Horizontal format (YouTube Shorts): crop to center if too tall
+        if original_height / original_width > 9 / 16:
+            half_height = int(original_width * 9 / 16) // 2
+            filters.append(f"crop={original_width}:{half_height * 2}:0:{original_height // 2 - half_height}")
+    
+    # Resize to target dimensions
+    target_width, target_height = aspect_output_size(original_width, original_height, target_format)
+    filters.append(f"scale={target_width}:{target_height}")
+    return ",".join(filters)
+
+
+def build_smart_crop_filter(regions: List[Dict], clip_start: float, clip_duration: float) -> Optional[Tuple[str, str]]:
+    """Turn face-tracking crop regions into a moving ffmpeg crop.
+    
+    The window position is smoothed with a gaussian over the keyframes and
+    written as a sendcmd script that moves the crop whenever it changes, so
+    ffmpeg follows the subject without any per-frame Python. Times are
+    relative to ``clip_start``. Returns (filter, script path), or None when
+    no region covers the clip; the caller removes the script.
+    """
+    if not regions:
+        return None
+    
+    # Sort once; keep one keyframe either side of the clip so the edges hold
+    timestamps = np.fromiter((r["timestamp"] for r in regions), dtype=np.float64, count=len(regions))
+    order = np.argsort(timestamps, kind="stable")
+    timestamps = timestamps[order]
+    first = max(0, np.searchsorted(timestamps, clip_start, side="right") - 1)
+    last = np.searchsorted(timestamps, clip_start + clip_duration, side="left") + 1
+    window = order[first:last]
+    if len(window) == 0:
+        return None
+    
+    xs = np.array([regions[i]["x"] for i in window], dtype=np.float64)
+    ys = np.array([regions[i]["y"] for i in window], dtype=np.float64)
+    if len(window) > 1 and SMART_CROP_SIGMA > 0:
+        xs = gaussian_filter1d(xs, SMART_CROP_SIGMA, mode="nearest")
+        ys = gaussian_filter1d(ys, SMART_CROP_SIGMA, mode="nearest")
+    xs = np.rint(xs).astype(np.int64)
+    ys = np.rint(ys).astype(np.int64)
+    times = np.maximum(timestamps[first:last] - clip_start, 0)
+    
+    # Only emit a command where the window actually moves
+    moved = np.ones(len(window), dtype=bool)
+    moved[1:] = (xs[1:] != xs[:-1]) | (ys[1:] != ys[:-1])
+    
+    with tempfile.NamedTemporaryFile("w", delete=False, suffix=".cmd") as script:
+        script.writelines(
+            f"{t:.3f} crop@smart x {x}, crop@smart y {y};\n"
+            for t, x, y in zip(times[moved], xs[moved], ys[moved])
+        )
+    
+    width, height = regions[window[0]]["width"], regions[window[0]]["height"]
+    return f"sendcmd=f='{script.name}',crop@smart={width}:{height}:{xs[0]}:{ys[0]}", script.name
+
+
+def clip_subtitle_segments(segments: List[Dict], clip_start: float, clip_duration: float) -> List[Dict]:
+    """Shift transcript segments to clip time, dropping and trimming those outside the clip."""
+    relevant_segments = []
+    for segment in segments:
+        seg_start = segment["start"] - clip_start  # Adjust to clip time
+        seg_end = segment["end"] - clip_start
+        
+        if seg_start < clip_duration and seg_end > 0:
+            # Clip segment to video bounds
+            relevant_segments.append({
+                "start": max(0, seg_start),
+                "end": min(clip_duration, seg_end),
+                "text": segment["text"].strip()
+            })
+    
+    return relevant_segments
+
+
+def format_ass_timestamp(seconds: float) -> str:
+    """Format seconds as an ASS timestamp (H:MM:SS.cc)."""
+    centiseconds = int(round(seconds * 100))
+    hours, centiseconds = divmod(centiseconds, 360000)
+    minutes, centiseconds = divmod(centiseconds, 6000)
+    secs, centiseconds = divmod(centiseconds, 100)
+    return f"{hours}:{minutes:02d}:{secs:02d}.{centiseconds:02d}"
+
+
+def build_ass_file(segments: List[Dict], width: int, height: int) -> str:
+    """Write clip-relative subtitle segments to a temporary .ass file for libass.
+    
+    The style matches the old TextClip captions: 50px bold white text with a
+    black outline, bottom-centred and wrapped to 80% of the frame width.
+    Returns the file path; the caller removes it.
+    """
+    margin = int(width * 0.1)
+    lines = [
+        "[Script Info]",
+        "ScriptType: v4.00+",
+        f"PlayResX: {width}",
+        f"PlayResY: {height}",
+        "WrapStyle: 0",
+        "ScaledBorderAndShadow: yes",
+        "",
+        "[V4+ Styles]",
+        "Format: Name, Fontname, Fontsize, PrimaryColour, SecondaryColour, OutlineColour, BackColour, "
+        "Bold, Italic, Underline, StrikeOut, ScaleX, ScaleY, Spacing, Angle, BorderStyle, Outline, Shadow, "
+        "Alignment, MarginL, MarginR, MarginV, Encoding",
+        f"Style: Default,DejaVu Sans,50,&H00FFFFFF,&H00FFFFFF,&H00000000,&H00000000,"
+        f"-1,0,0,0,100,100,0,0,1,2,0,2,{margin},{margin},20,1",
+        "",
+        "[Events]",
+        "Format: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text",
+    ]
+    for segment in segments:
+        # Braces open override blocks and backslashes start tags in ASS text
+        text = segment["text"].replace("\\", "/").replace("{", "(").replace("}", ")").replace("\n", " ")
+        lines.append(
+            f"Dialogue: 0,{format_ass_timestamp(segment['start'])},{format_ass_timestamp(segment['end'])},"
+            f"Default,,0,0,0,,{text}"
+        )
+    
+    with tempfile.NamedTemporaryFile("w", delete=False, suffix=".ass", encoding="utf-8") as ass_file:
+        ass_file.write("\n".join(lines) + "\n")
+        return ass_file.name
+
+
+def build_watermark_filter() -> str:
+    """Build the drawtext filter for the free-tier watermark (top right, 70% opacity)."""
+    return (
+        f"drawtext=fontfile='{WATERMARK_FONT}':text='{WATERMARK_TEXT}':"
+        "fontsize=30:fontcolor=white@0.7:bordercolor=black@0.7:borderw=1:x=w-tw-10:y=10"
+    )
+
+
 def apply_aspect_ratio(clip: mp.VideoFileClip, target_format: str) -> mp.VideoFileClip:
     """Convert video to target aspect ratio."""
     original_width, original_height = clip.size
@@ -218,21 +696,7 @@ def add_subtitles(clip: mp.VideoFileClip, transcript: dict, start_time: float, e
     """Add animated subtitles to video clip."""
     try:
         # Filter transcript segments for this clip
-        relevant_segments = []
-        for segment in transcript["segments"]:
-            seg_start = segment["start"] - start_time  # Adjust to clip time
-            seg_end = segment["end"] - start_time
-            
-            if seg_start < clip.duration and seg_end > 0:
-                # Clip segment to video bounds
-                seg_start = max(0, seg_start)
-                seg_end = min(clip.duration, seg_end)
-                
-                relevant_segments.append({
-                    "start": seg_start,
-                    "end": seg_end,
-                    "text": segment["text"].strip()
-                })
+        relevant_segments = clip_subtitle_segments(transcript["segments"], start_time, clip.duration)
         
         if not relevant_segments:
             return clip
@@ -267,94 +731,6 @@ def add_subtitles(clip: mp.VideoFileClip, transcript: dict, start_time: float, e
         return clip
 
 
-def add_watermark(clip: mp.VideoFileClip) -> mp.VideoFileClip:
-    """Add watermark to video for free users."""
-    try:
-        # Create simple text watermark
-        watermark = mp.TextClip(
-            "ViralClips.ai",
-            fontsize=30,
-            color='white',
-            stroke_color='black',
-            stroke_width=1,
-            font='Arial'
-        ).set_position(('right', 'top')).set_duration(clip.duration).set_opacity(0.7)
-        
-        # Composite watermark with video
-        final_clip = mp.CompositeVideoClip([clip, watermark])
-        return final_clip
-        
-    except Exception as e:
-        print(f"Error adding watermark: {str(e)}")
-        return clip
-
-
-def apply_smart_crop(clip: mp.VideoFileClip, target_aspect: str, crop_data: dict = None) -> mp.VideoFileClip:
-    """Apply smart cropping using MediaPipe face/pose tracking data."""
-    try:
-        if crop_data and target_aspect in crop_data.get('crop_regions', {}):
-            # Use pre-calculated smart crop regions
-            regions = crop_data['crop_regions'][target_aspect]
-            
-            def smart_crop_func(get_frame, t):
-                # Find the crop region for this timestamp
-                frame = get_frame(t)
-                region = None
-                
-                # Find closest timestamp
-                for r in regions:
-                    if abs(r['timestamp'] - t) < 0.5:  # Within 0.5 seconds
-                        region = r
-                        break
-                
-                if region:
-                    # Apply the smart crop
-                    h, w = frame.shape[:2]
-                    x1 = max(0, region['x'])
-                    y1 = max(0, region['y'])
-                    x2 = min(w, region['x'] + region['width'])
-                    y2 = min(h, region['y'] + region['height'])
-                    
-                    return frame[y1:y2, x1:x2]
-                else:
-                    # Fallback to center crop
-                    return apply_center_crop_to_frame(frame, target_aspect)
-            
-            return clip.fl(smart_crop_func)
-        else:
-            # Fallback to center crop
-            return apply_center_crop(clip, target_aspect)
-        
-    except Exception as e:
-        print(f"Error in smart crop: {str(e)}")
-        return apply_center_crop(clip, target_aspect)
-
-
-def apply_center_crop(clip: mp.VideoFileClip, target_aspect: str) -> mp.VideoFileClip:
-    """Apply center crop to video."""
-    w, h = clip.size
-    
-    if target_aspect == "9:16":
-        # Vertical
-        if w / h > 9 / 16:
-            # Too wide, crop width
-            new_w = int(h * 9 / 16)
-            x1 = (w - new_w) // 2
-            clip = clip.crop(x1=x1, x2=x1 + new_w)
-    
-    elif target_aspect == "1:1":
-        # Square
-        size = min(w, h)
-        if w > h:
-            x1 = (w - size) // 2
-            clip = clip.crop(x1=x1, x2=x1 + size)
-        elif h > w:
-            y1 = (h - size) // 2
-            clip = clip.crop(y1=y1, y2=y1 + size)
-    
-    return clip
-
-
 def enhance_video_quality(clip: mp.VideoFileClip) -> mp.VideoFileClip:
     """Apply basic video enhancements."""
     try:
@@ -366,59 +742,62 @@ def enhance_video_quality(clip: mp.VideoFileClip) -> mp.VideoFileClip:
         return clip
 
 
-def generate_thumbnail(clip: mp.VideoFileClip, output_path: str):
-    """Generate thumbnail from video clip."""
+def generate_thumbnail(input_path: str, output_path: str, t: Optional[float] = None):
+    """Generate a 640px-wide JPEG thumbnail from a video file or URL.
+    
+    Without ``t`` ffmpeg's thumbnail filter picks the most representative
+    frame of the opening batch; with ``t`` the frame at that time is used.
+    """
     try:
-        # Extract frame from middle of clip
-        frame_time = clip.duration / 2
-        frame = clip.get_frame(frame_time)
+        if t is None:
+            seek, video_filter = [], "thumbnail,scale=640:-2"
+        else:
+            seek, video_filter = ["-ss", f"{t:.3f}"], "scale=640:-2"
         
-        # Save as JPEG
-        import PIL.Image as Image
-        img = Image.fromarray(frame)
-        img.save(output_path, "JPEG", quality=85)
+        _run_ffmpeg([
+            FFMPEG_BINARY, "-y", "-nostdin", "-loglevel", "error",
+            *seek, "-i", input_path,
+            "-vf", video_filter, "-frames:v", "1",
+            "-c:v", "mjpeg", "-q:v", str(THUMBNAIL_JPEG_QSCALE), output_path
+        ])
         
     except Exception as e:
         print(f"Error generating thumbnail: {str(e)}")
 
 
-def create_preview_gif(clip: mp.VideoFileClip, output_path: str, duration: float = 3.0):
-    """Create a short GIF preview of the clip."""
-    try:
-        # Create short preview clip
-        preview_clip = clip.subclip(0, min(duration, clip.duration))
-        
-        # Resize for smaller file size
-        preview_clip = preview_clip.resize(0.5)
-        
-        # Export as GIF
-        preview_clip.write_gif(output_path, fps=10, verbose=False, logger=None)
-        
-    except Exception as e:
-        print(f"Error creating preview GIF: {str(e)}")
+def save_frame_jpeg(frame: np.ndarray, output_path: str):
+    """Encode an already decoded RGB frame as JPEG with ffmpeg's mjpeg encoder.
+    
+    The frame is piped to ffmpeg as raw video, so it is not copied into PIL.
+    """
+    height, width = frame.shape[:2]
+    result = subprocess.run(
+        [FFMPEG_BINARY, "-y", "-loglevel", "error",
+         "-f", "rawvideo", "-pix_fmt", "rgb24", "-s", f"{width}x{height}", "-i", "pipe:0",
+         "-frames:v", "1", "-c:v", "mjpeg", "-q:v", str(THUMBNAIL_JPEG_QSCALE), output_path],
+        input=np.ascontiguousarray(frame, dtype=np.uint8).tobytes(),
+        stdout=subprocess.DEVNULL, stderr=subprocess.PIPE
+    )
+    if result.returncode != 0:
+        raise Exception(f"JPEG encode failed: {result.stderr.decode(errors='ignore').strip()}")
 
 
-def add_intro_outro(clip: mp.VideoFileClip, user_subscription: str) -> mp.VideoFileClip:
-    """Add intro/outro for branding."""
+def create_preview_gif(input_path: str, output_path: str, duration: float = 3.0):
+    """Create a short, half-size GIF preview of a video file or URL."""
     try:
-        if user_subscription == "free":
-            # Add simple text intro for free users
-            intro = mp.TextClip(
-                "Made with ViralClips.ai",
-                fontsize=40,
-                color='white',
-                bg_color='black'
-            ).set_duration(1).set_position('center')
-            
-            # Combine intro + main clip
-            final_clip = mp.concatenate_videoclips([intro, clip])
-            return final_clip
-        
-        return clip
+        # Build a palette from the preview itself and dither against it, in
+        # one ffmpeg pass: far smaller and faster than MoviePy's GIF writer
+        _run_ffmpeg([
+            FFMPEG_BINARY, "-y", "-nostdin", "-loglevel", "error",
+            "-t", f"{duration:.3f}", "-i", input_path,
+            "-filter_complex",
+            "[0:v]fps=10,scale=iw/2:-1:flags=lanczos,split[frames][source];"
+            "[source]palettegen[palette];[frames][palette]paletteuse",
+            "-loop", "0", output_path
+        ])
         
     except Exception as e:
-        print(f"Error adding intro/outro: {str(e)}")
-        return clip
+        print(f"Error creating preview GIF: {str(e)}")
 
 
 def optimize_for_platform(clip: mp.VideoFileClip, platform: str) -> mp.VideoFileClip:
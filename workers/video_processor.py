@@ -1,10 +1,10 @@
 import os
 import sys
+import json
+import subprocess
 import tempfile
 from datetime import datetime
 import yt_dlp
-import moviepy.editor as mp
-from moviepy.video.io.VideoFileClip import VideoFileClip
 
 # Add shared directory to path
 sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'shared'))
@@ -12,62 +12,106 @@ sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'shared'))
 from database import Database
 from utils import generate_id, get_video_filename, sanitize_filename
 from schemas import JobStatus
+from media import FFMPEG_BINARY, probe_video
 
 
 db = Database()
 
+# Single-file formats only, so yt-dlp can write the download to stdout
+YOUTUBE_FORMAT = 'best[height<=720]'
+
+# Read size for the remuxed download as it is uploaded
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+# Lifetime of the signed URL ffprobe reads an upload's headers from, in seconds
+PROBE_URL_EXPIRY = 300
+
 
 def download_youtube_video(video_id: str, youtube_url: str):
-    """Download video from YouTube and upload to storage."""
+    """Download video from YouTube and stream it into storage.
+    
+    yt-dlp writes the download to stdout, ffmpeg remuxes it to fragmented
+    MP4 on the fly and the result is uploaded as it arrives, so the video
+    never touches disk or sits whole in memory.
+    """
     try:
         # Update job status
         print(f"Starting YouTube download for video {video_id}")
         
         # Configure yt-dlp options
         ydl_opts = {
-            'format': 'best[height<=720]',  # Limit quality to save bandwidth
-            'outtmpl': f'temp_%(id)s.%(ext)s',
+            'format': YOUTUBE_FORMAT,  # Limit quality to save bandwidth
             'noplaylist': True,
+            'quiet': True,
         }
         
+        # Extract video info once; the download reuses it
         with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            # Extract video info
-            info = ydl.extract_info(youtube_url, download=False)
-            title = sanitize_filename(info.get('title', 'Unknown'))
-            duration = info.get('duration', 0)
-            
-            # Download video
-            download_info = ydl.extract_info(youtube_url, download=True)
-            temp_filename = ydl.prepare_filename(download_info)
-            
-            # Get file size
-            file_size = os.path.getsize(temp_filename)
-            
-            # Upload to Supabase storage
-            with open(temp_filename, 'rb') as f:
-                file_data = f.read()
-                file_path = f"videos/{video_id}.mp4"
-                db.storage.upload_file(file_path, file_data)
+            info = ydl.sanitize_info(ydl.extract_info(youtube_url, download=False))
+        title = sanitize_filename(info.get('title', 'Unknown'))
+        duration = info.get('duration', 0)
+        
+        with tempfile.NamedTemporaryFile("w", suffix=".info.json") as info_file, \
+             tempfile.TemporaryFile() as download_errors, \
+             tempfile.TemporaryFile() as remux_errors:
+            json.dump(info, info_file)
+            info_file.flush()
             
-            # Update video record
-            updates = {
-                "title": title,
-                "duration": duration,
-                "file_size": file_size,
-                "status": JobStatus.COMPLETED.value,
-                "updated_at": datetime.utcnow().isoformat()
-            }
-            db.update_video(video_id, updates)
+            download = subprocess.Popen(
+                [sys.executable, "-m", "yt_dlp", "--quiet", "--no-progress",
+                 "--load-info-json", info_file.name, "-f", YOUTUBE_FORMAT, "-o", "-"],
+                stdout=subprocess.PIPE, stderr=download_errors
+            )
+            # Fragmented MP4 can be written to a pipe; the trailing mfra index
+            # keeps it seekable for the range reads done by later jobs
+            remux = subprocess.Popen(
+                [FFMPEG_BINARY, "-nostdin", "-loglevel", "error", "-i", "pipe:0",
+                 "-c", "copy", "-f", "mp4", "-movflags", "+frag_keyframe+empty_moov", "pipe:1"],
+                stdin=download.stdout, stdout=subprocess.PIPE, stderr=remux_errors
+            )
+            # Only ffmpeg reads yt-dlp's output; closing our copy lets yt-dlp
+            # see a broken pipe if ffmpeg exits early
+            download.stdout.close()
             
-            # Clean up temp file
-            if os.path.exists(temp_filename):
-                os.remove(temp_filename)
+            file_size = 0
             
-            print(f"YouTube download completed for video {video_id}")
+            def chunks():
+                nonlocal file_size
+                while chunk := remux.stdout.read(UPLOAD_CHUNK_SIZE):
+                    file_size += len(chunk)
+                    yield chunk
             
-            # Automatically start transcription
-            transcribe_video(video_id)
+            # Upload to Supabase storage as the remuxed stream arrives
+            file_path = f"videos/{video_id}.mp4"
+            try:
+                db.storage.upload_stream(file_path, chunks())
+            finally:
+                for process in (remux, download):
+                    if process.poll() is None:
+                        process.kill()
+                    process.wait()
             
+            for process, errors, name in ((download, download_errors, "yt-dlp"), (remux, remux_errors, "ffmpeg")):
+                if process.returncode != 0:
+                    errors.seek(0)
+                    db.storage.delete_file(file_path)
+                    raise Exception(f"{name} failed: {errors.read().decode(errors='ignore').strip()}")
+        
+        # Update video record
+        updates = {
+            "title": title,
+            "duration": duration,
+            "file_size": file_size,
+            "status": JobStatus.COMPLETED.value,
+            "updated_at": datetime.utcnow().isoformat()
+        }
+        db.update_video(video_id, updates)
+        
+        print(f"YouTube download completed for video {video_id}")
+        
+        # Automatically start transcription
+        transcribe_video(video_id)
+        
     except Exception as e:
         print(f"Error downloading YouTube video {video_id}: {str(e)}")
         # Update video status to failed
@@ -87,39 +131,23 @@ def process_video(video_id: str):
         if not video:
             raise Exception("Video not found")
         
-        # Download video from storage for processing
-        file_data = db.storage.download_file(video["file_path"])
+        # ffprobe reads just the container headers straight from storage;
+        # no need to download the whole upload first
+        metadata = probe_video(db.storage.create_signed_url(video["file_path"], PROBE_URL_EXPIRY))
         
-        # Save to temporary file for moviepy
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.mp4') as temp_file:
-            temp_file.write(file_data)
-            temp_path = temp_file.name
+        # Update video record with metadata
+        updates = {
+            "duration": metadata["duration"],
+            "status": JobStatus.COMPLETED.value,
+            "updated_at": datetime.utcnow().isoformat()
+        }
+        db.update_video(video_id, updates)
+        
+        print(f"Video processing completed for {video_id}")
+        
+        # Automatically start transcription
+        transcribe_video(video_id)
         
-        try:
-            # Get video metadata using moviepy
-            with VideoFileClip(temp_path) as clip:
-                duration = clip.duration
-                width = clip.w
-                height = clip.h
-            
-            # Update video record with metadata
-            updates = {
-                "duration": duration,
-                "status": JobStatus.COMPLETED.value,
-                "updated_at": datetime.utcnow().isoformat()
-            }
-            db.update_video(video_id, updates)
-            
-            print(f"Video processing completed for {video_id}")
-            
-            # Automatically start transcription
-            transcribe_video(video_id)
-            
-        finally:
-            # Clean up temp file
-            if os.path.exists(temp_path):
-                os.remove(temp_path)
-            
     except Exception as e:
         print(f"Error processing video {video_id}: {str(e)}")
         db.update_video(video_id, {
@@ -157,15 +185,9 @@ def transcribe_video(video_id: str):
 
 
 def get_video_metadata(file_path: str) -> dict:
-    """Extract metadata from video file."""
+    """Extract metadata from a video file or URL."""
     try:
-        with VideoFileClip(file_path) as clip:
-            return {
-                "duration": clip.duration,
-                "width": clip.w,
-                "height": clip.h,
-                "fps": clip.fps
-            }
+        return probe_video(file_path)
     except Exception as e:
         print(f"Error extracting video metadata: {str(e)}")
-        return {"duration": 0, "width": 0, "height": 0, "fps": 0}
+        return {"duration": 0, "width": 0, "height": 0, "fps": 0, "has_audio": False}
@@ -10,12 +10,24 @@ Environment variables required:
     REDIS_URL - Redis connection URL
     SUPABASE_URL - Supabase project URL
     SUPABASE_ANON_KEY - Supabase anonymous key
+
+Optional:
+    WORKER_PROCESSES - Workers serving all queues, besides the one kept
+                       for the high priority queue (default 2)
+    WORKER_RESTART_DELAY - Seconds before restarting a worker that exited,
+                           doubled for each quick crash in a row (default 1)
+    WORKER_MAX_CRASHES - Quick crashes in a row after which the supervisor
+                         stops instead of restarting (default 5)
 """
 
 import os
 import sys
+import signal
+import time
+import multiprocessing
+from multiprocessing.connection import wait
 import redis
-from rq import Worker, Queue, Connection
+from rq import SimpleWorker, Queue
 from dotenv import load_dotenv
 
 # Load environment variables
@@ -25,34 +37,114 @@ load_dotenv()
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'shared'))
 
-# Import worker functions
-from video_processor import download_youtube_video, process_video
-from transcription import transcribe_video
-from highlight_detector import detect_highlights
-from video_editor import export_clip
+# Worker processes serving every queue, highest priority first; size this to
+# the GPU's NVENC session limit (typically 2-3 on consumer cards). Every
+# process, the dedicated one included, loads its own copy of the models:
+# budget about 1.5 GB of VRAM each for the CUDA context, Whisper base, the
+# sentiment model and KeyBERT, and more when WhisperX alignment and
+# diarization are installed. CPU inference threads are split between them.
+WORKER_PROCESSES = int(os.environ.get("WORKER_PROCESSES", "2"))
 
-def main():
-    """Start the RQ worker."""
+# Restart backoff: the delay doubles for each crash in a row, up to a cap; a
+# worker that stays up for WORKER_STABLE_SECONDS starts over from the base
+WORKER_RESTART_DELAY = float(os.environ.get("WORKER_RESTART_DELAY", "1"))
+WORKER_RESTART_DELAY_MAX = 60.0
+WORKER_MAX_CRASHES = int(os.environ.get("WORKER_MAX_CRASHES", "5"))
+WORKER_STABLE_SECONDS = 300.0
+
+# Queues in priority order, and the queues a dedicated process keeps free for
+QUEUE_NAMES = ["high", "default", "low"]
+DEDICATED_QUEUE_NAMES = ["high"]
+
+
+def run_worker(queue_names):
+    """Load the job modules once, then process jobs in this process.
+    
+    SimpleWorker runs jobs without forking, so models, the database client
+    and the hardware encoder probe stay warm from one job to the next.
+    """
+    # Leave the terminal's process group so Ctrl+C reaches only the
+    # supervisor, which then sends each worker a single SIGTERM
+    os.setpgrp()
+    
+    # Import worker functions so models load before the first job
+    from video_processor import download_youtube_video, process_video
+    from transcription import transcribe_video
+    from highlight_detector import detect_highlights
+    from video_editor import export_clip, get_encoder_caps
     
     # Connect to Redis
     redis_url = os.environ.get('REDIS_URL', 'redis://localhost:6379')
     redis_conn = redis.from_url(redis_url)
     
-    # Create queues
-    high_priority_queue = Queue('high', connection=redis_conn)
-    default_queue = Queue('default', connection=redis_conn)
-    low_priority_queue = Queue('low', connection=redis_conn)
+    queues = [Queue(name, connection=redis_conn) for name in queue_names]
+    print(f"Worker {os.getpid()} listening on queues: {queue_names}")
     
-    # Worker will process jobs from these queues in order
-    queues = [high_priority_queue, default_queue, low_priority_queue]
+    # Probe hardware encoders now rather than on the first export job
+    print(f"Hardware encoders: {get_encoder_caps()}")
     
-    print("Starting RQ worker...")
+    worker = SimpleWorker(queues, connection=redis_conn)
+    worker.work()
+
+
+def main():
+    """Start the RQ workers and restart any that exit, backing off on repeated crashes."""
+    redis_url = os.environ.get('REDIS_URL', 'redis://localhost:6379')
+    
+    print("Starting RQ workers...")
     print(f"Connected to Redis at: {redis_url}")
-    print(f"Listening on queues: {[q.name for q in queues]}")
     
-    # Start worker
-    worker = Worker(queues, connection=redis_conn)
-    worker.work()
+    # Spawn rather than fork: CUDA cannot be used in a forked child
+    context = multiprocessing.get_context("spawn")
+    assignments = [DEDICATED_QUEUE_NAMES] + [QUEUE_NAMES] * WORKER_PROCESSES
+    
+    # Spawned workers inherit the environment; they size their thread pools by it
+    os.environ["WORKER_PROCESS_COUNT"] = str(len(assignments))
+    
+    processes = {}
+    
+    def start(queue_names, crashes):
+        process = context.Process(target=run_worker, args=(queue_names,))
+        process.start()
+        processes[process.sentinel] = (process, queue_names, time.monotonic(), crashes)
+    
+    for queue_names in assignments:
+        start(queue_names, 0)
+    
+    # Stop on SIGTERM as on Ctrl+C; each worker finishes its current job
+    def stop(signum, frame):
+        raise KeyboardInterrupt
+    signal.signal(signal.SIGTERM, stop)
+    
+    pending = []  # (restart time, queue names, crashes in a row)
+    exit_code = 0
+    try:
+        while True:
+            now = time.monotonic()
+            for restart in [restart for restart in pending if restart[0] <= now]:
+                pending.remove(restart)
+                start(restart[1], restart[2])
+            
+            timeout = max(0.0, min(restart[0] for restart in pending) - now) if pending else None
+            for sentinel in wait(list(processes), timeout):
+                process, queue_names, started, crashes = processes.pop(sentinel)
+                crashes = 0 if time.monotonic() - started >= WORKER_STABLE_SECONDS else crashes + 1
+                if crashes > WORKER_MAX_CRASHES:
+                    print(f"Worker on {queue_names} crashed {crashes} times in a row, stopping")
+                    exit_code = 1
+                    raise KeyboardInterrupt
+                
+                delay = min(WORKER_RESTART_DELAY * 2 ** max(crashes - 1, 0), WORKER_RESTART_DELAY_MAX)
+                print(f"Worker {process.pid} on {queue_names} exited with code {process.exitcode}, "
+                      f"restarting in {delay:g}s")
+                pending.append((time.monotonic() + delay, queue_names, crashes))
+    except KeyboardInterrupt:
+        for process, *_ in processes.values():
+            process.terminate()
+        for process, *_ in processes.values():
+            process.join()
+    
+    sys.exit(exit_code)
 
 if __name__ == '__main__':
     main()